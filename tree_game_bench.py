@@ -0,0 +1,238 @@
+import argparse
+import json
+import os
+import platform
+import random
+import time
+import timeit
+
+import tree_game_lib
+
+# The boards every run of the suite times, so runs can be compared
+SIZES = [[6, 6], [15, 30], [50, 50], [100, 100], [200, 200], [500, 500]]
+DENSITIES = [20, 40, 60]
+SEED = 20240601
+
+
+def legacy_get(board, row, col):
+    """The old get(), which raised and caught OutOfRange to find the edges.
+
+    Kept here only so the benchmark has something to compare with.
+
+    Args:
+        board - A list of lists board
+        row   - Any integer
+        col   - Any integer
+
+    Returns:
+        The contents of board[row][col], or BOARD_OUT_OF_BOUNDS
+    """
+    try:
+        if row > len(board) - 1 or row < 0:
+            raise tree_game_lib.OutOfRange("row of %d is outside range 0..%d" % (row, len(board) - 1))
+        if col > len(board[0]) - 1 or col < 0:
+            raise tree_game_lib.OutOfRange("col of %d is outside range 0..%d" % (col, len(board[0]) - 1))
+    except tree_game_lib.OutOfRange:
+        return tree_game_lib.BOARD_OUT_OF_BOUNDS
+
+    return board[row][col]
+
+
+def edge_squares(rows, cols):
+    """The squares along the edges of a rows x cols board."""
+    squares = []
+    for row in range(rows):
+        for col in range(cols):
+            if row in [0, rows - 1] or col in [0, cols - 1]:
+                squares.append([row, col])
+    return squares
+
+
+def bench_get(rows=50, cols=50, number=20):
+    """Time 3x3 neighbour scans around every edge square of a board.
+
+    Edge squares are the worst case for get(): most of their
+    neighbours are off the board.
+
+    Args:
+        rows   - The number of rows on the board
+        cols   - The number of cols on the board
+        number - How many times to repeat each scan
+
+    Returns:
+        A dict of seconds per scan of all the edge squares, keyed
+        by the lookup being timed.
+    """
+    random.seed(0)
+    board = tree_game_lib.create_board(rows, cols)
+    squares = board.to_lists()
+    edges = edge_squares(rows, cols)
+    around = [[r, c] for r in [-1, 0, 1] for c in [-1, 0, 1]]
+    indexes = [board.index(row, col) for row, col in edges]
+
+    def scan_legacy():
+        for row, col in edges:
+            for r, c in around:
+                legacy_get(squares, row + r, col + c)
+
+    def scan_lists():
+        for row, col in edges:
+            for r, c in around:
+                tree_game_lib.get(squares, row + r, col + c)
+
+    def scan_board():
+        for row, col in edges:
+            for r, c in around:
+                tree_game_lib.get(board, row + r, col + c)
+
+    def scan_padded():
+        cells = board.cells
+        for index in indexes:
+            for offset in board.around:
+                cells[index + offset]
+
+    results = {}
+    for name, scan in [['legacy get()', scan_legacy], ['get(list)', scan_lists],
+                       ['get(Board)', scan_board], ['Board.cells[index + offset]', scan_padded]]:
+        results[name] = timeit.timeit(scan, number=number) / number
+    return results
+
+
+def best_time(function, setup=None, repeat=3):
+    """The fastest of several timed calls of function.
+
+    Args:
+        function - Called with whatever setup returns
+        setup    - Optional, called before each timed call, untimed,
+                   to build fresh arguments
+        repeat   - How many times to time the call
+
+    Returns:
+        Seconds taken by the fastest call
+    """
+    fastest = None
+    for i in range(repeat):
+        args = setup() if setup else []
+        start = time.perf_counter()
+        function(*args)
+        seconds = time.perf_counter() - start
+        if fastest is None or seconds < fastest:
+            fastest = seconds
+    return fastest
+
+
+def bench_board(rows, cols, density, seed=SEED, repeat=3):
+    """Time each stage of making and solving one board.
+
+    Args:
+        rows    - The number of rows on the board
+        cols    - The number of cols on the board
+        density - The density of trees as a percentage (0-100)
+        seed    - The seed the board is created from
+        repeat  - How many times to time each stage
+
+    Returns:
+        A dict describing the board, with the seconds each stage took
+    """
+    board = tree_game_lib.create_board(rows, cols, density=density, rng=seed)
+
+    def filled():
+        guess = tree_game_lib.create_guess_board(board)
+        tree_game_lib.fill_empty(board, guess)
+        return [board, guess]
+
+    with open(os.devnull, 'w') as null:
+        seconds = {
+            'create_board': best_time(lambda: tree_game_lib.create_board(rows, cols, density=density, rng=seed),
+                                      repeat=repeat),
+            'create_guess_board': best_time(tree_game_lib.create_guess_board, lambda: [board], repeat=repeat),
+            'fill_empty': best_time(tree_game_lib.fill_empty,
+                                    lambda: [board, tree_game_lib.create_guess_board(board)], repeat=repeat),
+            'solver': best_time(tree_game_lib.solver, filled, repeat=repeat),
+            # Comparing the board with itself never stops early
+            'solved': best_time(tree_game_lib.solved, lambda: [board, board], repeat=repeat),
+            'print_board': best_time(tree_game_lib.print_board, lambda: filled() + [None, null], repeat=repeat),
+        }
+
+    return {'rows': rows, 'cols': cols, 'density': density, 'seed': seed, 'seconds': seconds}
+
+
+def run_suite(sizes=SIZES, densities=DENSITIES, seed=SEED, repeat=3, verbose=False):
+    """Time every stage on every size and density of board.
+
+    Returns:
+        A dict that json.dump() can write out, with one entry in
+        'results' per board
+    """
+    results = []
+    for rows, cols in sizes:
+        for density in densities:
+            result = bench_board(rows, cols, density, seed=seed, repeat=repeat)
+            if verbose:
+                print("%4dx%-4d %3d%%  " % (rows, cols, density) +
+                      "  ".join("%s %.4f" % (name, seconds) for name, seconds in result['seconds'].items()))
+            results.append(result)
+    return {'python': platform.python_version(), 'repeat': repeat, 'results': results}
+
+
+def compare(old, new):
+    """Compare two runs of the suite.
+
+    Args:
+        old - The dict a previous run_suite() returned
+        new - The dict this run_suite() returned
+
+    Returns:
+        A list of lines, one per board and stage timed in both runs,
+        giving new time / old time. Below 1.0 is faster.
+    """
+    before = {}
+    for result in old['results']:
+        before[result['rows'], result['cols'], result['density']] = result['seconds']
+
+    lines = []
+    for result in new['results']:
+        key = result['rows'], result['cols'], result['density']
+        if key not in before:
+            continue
+        for name, seconds in result['seconds'].items():
+            if before[key].get(name):
+                lines.append("%4dx%-4d %3d%%  %-20s %8.4f -> %8.4f  x%.2f" % (
+                    key[0], key[1], key[2], name, before[key][name], seconds, seconds / before[key][name]))
+    return lines
+
+
+def parse_sizes(text):
+    """Parse '6x6,50x50' into [[6, 6], [50, 50]]."""
+    return [[int(n) for n in size.split('x')] for size in text.split(',')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the Maine Trees board functions.')
+    parser.add_argument('--sizes', type=parse_sizes, default=SIZES, help='e.g. 6x6,50x50')
+    parser.add_argument('--densities', default=DENSITIES,
+                        type=lambda text: [int(n) for n in text.split(',')], help='e.g. 20,40')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='compare with the results in this JSON file')
+    parser.add_argument('--get', action='store_true', help='run the get() micro-benchmark instead')
+    args = parser.parse_args()
+
+    if args.get:
+        for name, seconds in bench_get().items():
+            print("%-30s %8.3f ms" % (name, seconds * 1000))
+        return
+
+    results = run_suite(args.sizes, args.densities, seed=args.seed, repeat=args.repeat, verbose=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    if args.compare:
+        with open(args.compare) as f:
+            for line in compare(json.load(f), results):
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+import tree_game_lib
+
+# A bitboard version of the board engine, for boards up to 64 cols.
+# Each kind of square is a list with one int per row, where bit col
+# is set if that square of the row is of that kind. Rules then work
+# on whole rows at a time: a 3x3 neighbourhood is a shift-and-OR of
+# three rows, and counting tents is counting set bits.
+
+MAX_COLS = 64
+
+
+class BitBoard:
+    """A board stored as one bitmask per row for each kind of square.
+
+    Attributes:
+        rows    - The number of rows on the board
+        cols    - The number of cols on the board
+        full    - A mask with a bit set for every col
+        tents   - The tents in each row
+        trees   - The trees in each row
+        empties - The empty squares in each row
+        marks   - The squares marked as empty (BOARD_EMPTY_GUESS)
+    """
+    __slots__ = ('rows', 'cols', 'full', 'tents', 'trees', 'empties', 'marks')
+
+    def __init__(self, rows, cols):
+        if cols > MAX_COLS:
+            raise ValueError("a BitBoard can have at most %d cols, not %d" % (MAX_COLS, cols))
+        self.rows = rows
+        self.cols = cols
+        self.full = (1 << cols) - 1
+        self.tents = [0] * rows
+        self.trees = [0] * rows
+        self.empties = [self.full] * rows
+        self.marks = [0] * rows
+
+    @classmethod
+    def from_board(cls, board):
+        """Build a BitBoard from a Board or a list of lists board."""
+        board = tree_game_lib.as_board(board)
+        bits = cls(board.rows, board.cols)
+        masks = {
+            tree_game_lib.CELL_TENT: bits.tents,
+            tree_game_lib.CELL_TREE: bits.trees,
+            tree_game_lib.CELL_EMPTY: bits.empties,
+            tree_game_lib.CELL_EMPTY_GUESS: bits.marks,
+        }
+        for row in range(board.rows):
+            bits.empties[row] = 0
+            start = board.row_start[row]
+            for col, cell in enumerate(board.cells[start:start + board.cols]):
+                masks[cell][row] |= 1 << col
+        return bits
+
+    def to_board(self):
+        """Convert back into a Board."""
+        board = tree_game_lib.Board(self.rows, self.cols)
+        for row in range(self.rows):
+            for cell, mask in [[tree_game_lib.CELL_TENT, self.tents[row]],
+                               [tree_game_lib.CELL_TREE, self.trees[row]],
+                               [tree_game_lib.CELL_EMPTY_GUESS, self.marks[row]]]:
+                while mask:
+                    low = mask & -mask
+                    board.set_cell(row, low.bit_length() - 1, cell)
+                    mask ^= low
+        return board
+
+    def copy(self):
+        bits = BitBoard.__new__(BitBoard)
+        bits.rows = self.rows
+        bits.cols = self.cols
+        bits.full = self.full
+        bits.tents = list(self.tents)
+        bits.trees = list(self.trees)
+        bits.empties = list(self.empties)
+        bits.marks = list(self.marks)
+        return bits
+
+
+def create_guess_board(board):
+    """A copy of a BitBoard with the tents replaced by empty."""
+    guess = board.copy()
+    for row in range(guess.rows):
+        guess.empties[row] |= guess.tents[row]
+        guess.tents[row] = 0
+    return guess
+
+
+def mark(guess, row, mask):
+    """Mark the empty squares of a row that are set in mask as empty guesses."""
+    mask &= guess.empties[row]
+    guess.empties[row] ^= mask
+    guess.marks[row] |= mask
+
+
+def pitch(guess, row, mask):
+    """Put tents on the empty squares of a row that are set in mask."""
+    mask &= guess.empties[row]
+    guess.empties[row] ^= mask
+    guess.tents[row] |= mask
+
+
+def spread(masks, full):
+    """For each row, the squares with a set square left or right of them."""
+    return [((mask << 1) | (mask >> 1)) & full for mask in masks]
+
+
+def adjacent(masks, full):
+    """For each row, the squares with a set square up, down, left or right of them."""
+    result = spread(masks, full)
+    for row in range(1, len(masks)):
+        result[row] |= masks[row - 1]
+        result[row - 1] |= masks[row]
+    return result
+
+
+def around(masks, full):
+    """For each row, the squares that are set or have a set square among the 8 around them."""
+    wide = [(mask | (mask << 1) | (mask >> 1)) & full for mask in masks]
+    result = list(wide)
+    for row in range(1, len(masks)):
+        result[row] |= wide[row - 1]
+        result[row - 1] |= wide[row]
+    return result
+
+
+def exactly_one(masks, full):
+    """For each row, the squares with exactly one set square up, down, left or right of them."""
+    result = []
+    for row, mask in enumerate(masks):
+        a = (mask << 1) & full
+        b = mask >> 1
+        c = masks[row - 1] if row > 0 else 0
+        d = masks[row + 1] if row + 1 < len(masks) else 0
+        two = (a & b) | (a & c) | (a & d) | (b & c) | (b & d) | (c & d)
+        result.append((a | b | c | d) & ~two)
+    return result
+
+
+def can_place_tent(board, row, col):
+    """Determine whether it is not illegal to place a tent at row,col.
+
+    The same question as tree_game_lib.can_place_tent(), answered by
+    and-ing a 3 bit wide mask against three rows of tents.
+    """
+    if row < 0 or row >= board.rows or col < 0 or col >= board.cols:
+        return False
+    if not board.empties[row] >> col & 1:
+        return False
+    block = (7 << col) >> 1
+    for r in range(max(row - 1, 0), min(row + 2, board.rows)):
+        if board.tents[r] & block:
+            return False
+    return True
+
+
+def count_tents(board, row=None, col=None):
+    """Count the number of tents in a given row or col."""
+    if row is not None:
+        return board.tents[row].bit_count()
+    return sum(tents >> col & 1 for tents in board.tents)
+
+
+def clues(board):
+    """The number of tents in each row and each col of a BitBoard."""
+    return [tents.bit_count() for tents in board.tents], col_counts(board.tents, board.cols)
+
+
+def col_counts(masks, cols):
+    """The number of set squares in each col.
+
+    Rather than test every bit of every row, add the rows together
+    in binary, every col at once: planes[i] holds bit i of each col's
+    count, and adding a row ripples a carry up through the planes.
+    """
+    planes = []
+    for mask in masks:
+        carry = mask
+        for i in range(len(planes)):
+            if not carry:
+                break
+            planes[i], carry = planes[i] ^ carry, planes[i] & carry
+        if carry:
+            planes.append(carry)
+    return [sum((plane >> col & 1) << i for i, plane in enumerate(planes)) for col in range(cols)]
+
+
+def fill_empty(board, guess):
+    """The rules of tree_game_lib.fill_empty(), a row at a time.
+
+    Args:
+        board - A BitBoard with its tents
+        guess - A BitBoard of the player's guesses, changed in place
+
+    Returns:
+        none
+    """
+    row_tents, col_tents = clues(board)
+    have = col_counts(guess.tents, guess.cols)
+    done = sum(1 << col for col in range(guess.cols) if have[col] == col_tents[col])
+    near_tree = adjacent(guess.trees, guess.full)
+
+    for row in range(guess.rows):
+        if guess.tents[row].bit_count() == row_tents[row]:
+            mark(guess, row, guess.full)
+        mark(guess, row, done | ~near_tree[row] & guess.full)
+
+
+def solver(board, guess):
+    """Fill in as much of guess as can be deduced, a row at a time.
+
+    The rules of tree_game_lib.solver(), each applied to whole rows
+    of squares with shifts, ANDs and ORs. For guesses that agree with
+    the board the result is the same.
+
+    Args:
+        board - A BitBoard with its tents
+        guess - A BitBoard of the player's guesses, changed in place
+
+    Returns:
+        none
+    """
+    row_tents, col_tents = clues(board)
+    full = guess.full
+    one_tree = exactly_one(guess.trees, full)
+
+    modified = True
+    while modified:
+        before = list(guess.empties)
+
+        # A row or col whose empty squares are all the tents it is missing
+        for row in range(guess.rows):
+            if guess.tents[row].bit_count() + guess.empties[row].bit_count() == row_tents[row]:
+                pitch(guess, row, full)
+
+        have = col_counts(guess.tents, guess.cols)
+        empty = col_counts(guess.empties, guess.cols)
+        done = sum(1 << col for col in range(guess.cols) if have[col] + empty[col] == col_tents[col])
+        for row in range(guess.rows):
+            pitch(guess, row, done)
+
+        # A tree that has no tents around it and only one empty adjacent square
+        near_tent = adjacent(guess.tents, full)
+        lonely = [trees & ~near_tent[row] & one_empty
+                  for row, (trees, one_empty) in enumerate(zip(guess.trees, exactly_one(guess.empties, full)))]
+        for row, mask in enumerate(adjacent(lonely, full)):
+            pitch(guess, row, mask)
+
+        # A square that has a tent cannot have tents around it
+        for row, mask in enumerate(around(guess.tents, full)):
+            mark(guess, row, mask)
+
+        # If a tent has only one tree near it, the empty squares around
+        # that tree that touch no other tree cannot have tents
+        claimed = adjacent([tents & one for tents, one in zip(guess.tents, one_tree)], full)
+        claimed = [trees & mask for trees, mask in zip(guess.trees, claimed)]
+        for row, mask in enumerate(adjacent(claimed, full)):
+            mark(guess, row, mask & one_tree[row])
+
+        modified = guess.empties != before
+
+
+def solved(board, guess):
+    """Does guess have exactly the tents of board?"""
+    return board.tents == guess.tents
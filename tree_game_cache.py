@@ -0,0 +1,238 @@
+import hashlib
+import json
+import os
+import struct
+from array import array
+from collections import OrderedDict
+
+import tree_game_lib
+
+# The puzzle a board makes is its trees and the tent counts along
+# its sides. Turning or flipping the board makes the same puzzle, so
+# canonical_form() tries all 8 ways and keeps the smallest, and every
+# one of them gets the same key in a SolveCache.
+#
+# An orientation is (transpose, flip_rows, flip_cols): first swap rows
+# and cols if transpose, then reverse the order of the rows and of the
+# squares in each row if asked to. The 8 combinations are the 8
+# symmetries of a rectangle, counting the ones that make it square.
+
+ORIENTATIONS = [(transpose, flip_rows, flip_cols)
+                for transpose in [False, True] for flip_rows in [False, True] for flip_cols in [False, True]]
+
+
+def orient(grid, orientation):
+    """Turn or flip a grid.
+
+    Args:
+        grid        - A list of rows, each a bytes
+        orientation - (transpose, flip_rows, flip_cols)
+
+    Returns:
+        The new list of rows
+    """
+    transpose, flip_rows, flip_cols = orientation
+    if transpose:
+        grid = [bytes(col) for col in zip(*grid)]
+    if flip_rows:
+        grid = grid[::-1]
+    if flip_cols:
+        grid = [row[::-1] for row in grid]
+    return grid
+
+
+def unorient(grid, orientation):
+    """Undo orient(grid, orientation)."""
+    transpose, flip_rows, flip_cols = orientation
+    return orient(orient(grid, (False, flip_rows, flip_cols)), (transpose, False, False))
+
+
+def canonical_form(board):
+    """The key of the puzzle a board makes, the same for all 8 of its symmetries.
+
+    Args:
+        board - A Board or a list of lists board, with its tents
+
+    Returns:
+        (key, orientation) - key is bytes, and orientation is how to
+        orient() the board to get the layout the key describes
+    """
+    board = tree_game_lib.as_board(board)
+    grid = [bytes(cell == tree_game_lib.CELL_TREE for cell in board.cells[start:start + board.cols])
+            for start in board.row_start]
+    row_tents, col_tents = tree_game_lib.clues(board)
+
+    best = None
+    for orientation in ORIENTATIONS:
+        transpose, flip_rows, flip_cols = orientation
+        rows, cols = (row_tents, col_tents) if not transpose else (col_tents, row_tents)
+        if flip_rows:
+            rows = rows[::-1]
+        if flip_cols:
+            cols = cols[::-1]
+        squares = orient(grid, orientation)
+        key = struct.pack('<HH', len(rows), len(cols)) + b''.join(squares) + \
+            array('H', rows).tobytes() + array('H', cols).tobytes()
+        if best is None or key < best[0]:
+            best = (key, orientation)
+    return best
+
+
+def puzzle_hash(board):
+    """A short hex digest of canonical_form(), for spotting repeated puzzles."""
+    return hashlib.blake2b(canonical_form(board)[0], digest_size=16).hexdigest()
+
+
+def check_entry(key, count, tents):
+    """Check that a SolveCache entry read from a file makes sense.
+
+    Args:
+        key    - The canonical_form() key, bytes
+        count  - The number of solutions, 0, 1 or 2
+        tents  - The solution, bytes of 0 and 1, or None
+
+    Returns:
+        True if the key is a whole puzzle and the solution fits it
+    """
+    if len(key) < 4 or type(count) is not int or count not in (0, 1, 2):
+        return False
+    rows, cols = struct.unpack_from('<HH', key)
+    if len(key) != 4 + rows * cols + 2 * (rows + cols):
+        return False
+    if tents is None:
+        return count != 1
+    return count == 1 and len(tents) == rows * cols and not tents.translate(None, b'\x00\x01')
+
+
+def keep_new():
+    """Make a stage for tree_game_gen.stream_puzzles() that drops repeated puzzles.
+
+    A puzzle is a repeat if it, or a turned or flipped copy of it,
+    has been passed on before. The stage keeps a 16 byte digest of
+    each puzzle it has seen.
+
+    Returns:
+        The stage, which adds 'hash', the puzzle_hash(), to the metadata
+    """
+    seen = {}
+
+    def stage(item):
+        puzzle, solution, metadata = item
+        digest = puzzle_hash(solution)
+        if digest in seen:
+            return None
+        seen[digest] = True
+        metadata['hash'] = digest
+        return item
+    return stage
+
+
+class SolveCache:
+    """Remember the solutions of puzzles, keyed by their canonical form.
+
+    A puzzle is only solved the first time it, or any turned or
+    flipped copy of it, is asked about. The most recently used
+    maxsize puzzles are kept. With a path, the cache is loaded from
+    that file when it is made, and save() writes it back.
+
+    The file is JSON, a list of [key, count, tents] with the bytes in
+    hex, so loading it only ever reads data. Every entry is checked
+    as it is loaded, and a file that does not check out raises
+    ValueError.
+
+    Attributes:
+        maxsize - The most puzzles to remember
+        path    - Optional, the file to load from and save to
+        entries - An OrderedDict from each key to (count, tents),
+                  least recently used first. tents is the solution
+                  in the canonical orientation, or None unless the
+                  count is 1.
+        hits    - How many solve() calls were answered from the cache
+        misses  - How many solve() calls had to solve the puzzle
+    """
+    __slots__ = ('maxsize', 'path', 'entries', 'hits', 'misses')
+
+    def __init__(self, maxsize=4096, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+            while len(self.entries) > maxsize:
+                self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def solve(self, board):
+        """Count the solutions of the puzzle a board makes, and find it if there is one.
+
+        Args:
+            board - A Board or a list of lists board, with its tents
+
+        Returns:
+            (count, solution) - count is 0, 1 or 2 (for 2 or more), and
+            solution is a solved guess Board if count is 1, else None
+        """
+        board = tree_game_lib.as_board(board)
+        key, orientation = canonical_form(board)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+        else:
+            self.misses += 1
+            solutions = tree_game_lib.find_solutions(board, limit=2)
+            tents = None
+            if len(solutions) == 1:
+                tents = b''.join(orient(
+                    [bytes(cell == tree_game_lib.CELL_TENT for cell in solutions[0].cells[start:start + board.cols])
+                     for start in board.row_start], orientation))
+            entry = (len(solutions), tents)
+            self.entries[key] = entry
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+        count, tents = entry
+        if tents is None:
+            return count, None
+
+        # Turn the solution back to the way this board is facing
+        rows, cols = (board.cols, board.rows) if orientation[0] else (board.rows, board.cols)
+        grid = unorient([tents[row * cols:(row + 1) * cols] for row in range(rows)], orientation)
+        solution = tree_game_lib.create_guess_board(board)
+        cells = solution.cells
+        for row, start in enumerate(solution.row_start):
+            for col, tent in enumerate(grid[row]):
+                if tent:
+                    solution.put(start + col, tree_game_lib.CELL_TENT)
+                elif cells[start + col] == tree_game_lib.CELL_EMPTY:
+                    solution.put(start + col, tree_game_lib.CELL_EMPTY_GUESS)
+        return count, solution
+
+    def load(self, path):
+        """Read the entries save() wrote, least recently used first."""
+        entries = OrderedDict()
+        try:
+            with open(path, encoding='ascii') as f:
+                for key, count, tents in json.load(f):
+                    key = bytes.fromhex(key)
+                    tents = None if tents is None else bytes.fromhex(tents)
+                    if not check_entry(key, count, tents):
+                        raise ValueError
+                    entries[key] = (count, tents)
+        except (ValueError, TypeError):
+            # json.JSONDecodeError and UnicodeDecodeError are ValueErrors
+            raise ValueError("%s is not a SolveCache file" % path)
+        self.entries = entries
+
+    def save(self, path=None):
+        """Write the cache to a file, by default the one it was loaded from."""
+        path = path or self.path
+        work = path + '.tmp'
+        with open(work, 'w', encoding='ascii') as f:
+            json.dump([[key.hex(), count, None if tents is None else tents.hex()]
+                       for key, (count, tents) in self.entries.items()], f)
+        os.replace(work, path)
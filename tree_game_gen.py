@@ -0,0 +1,316 @@
+import itertools
+import os
+import random
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import tree_game_lib
+
+
+def generate_one(seed, rows, cols, density):
+    """Generate one puzzle in a worker process.
+
+    Each puzzle gets its own random.Random, so the puzzle a task
+    produces does not depend on which worker runs it or what that
+    worker ran before, and workers never share a generator.
+
+    Args:
+        seed    - The seed for the random number generator
+        rows    - The number of rows on the board
+        cols    - The number of cols on the board
+        density - The density of trees as a percentage (0-100)
+
+    Returns:
+        A Board whose puzzle has exactly one solution, the same one
+        tree_game_lib.puzzle_from_id() makes for the same seed
+    """
+    return tree_game_lib.generate_puzzle(rows, cols, density=density, rng=random.Random(seed))
+
+
+def generate_puzzles(n, rows, cols, density=40, workers=None, seed=None):
+    """Generate puzzles on a pool of worker processes.
+
+    Puzzles are yielded as soon as a worker finishes one, so they
+    can be written out while the rest are still being generated.
+    Only a few tasks per worker are queued at a time, so asking for
+    millions of puzzles does not queue millions of tasks up front.
+
+    Args:
+        n       - The number of puzzles to generate
+        rows    - The number of rows on each board
+        cols    - The number of cols on each board
+        density - The density of trees as a percentage (0-100)
+        workers - The number of worker processes, default one per CPU
+        seed    - Optional, puzzle i is generated from seed + i
+
+    Returns:
+        A generator of n (puzzle id, Board) pairs, in the order they
+        were finished. tree_game_lib.puzzle_from_id() regenerates the
+        Board from its id.
+    """
+    workers = workers or os.cpu_count() or 1
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        submitted = 0
+        while submitted < n or pending:
+            while submitted < n and len(pending) < 2 * workers:
+                future = pool.submit(generate_one, seed + submitted, rows, cols, density)
+                future.puzzle_id = tree_game_lib.puzzle_id(rows, cols, density, seed + submitted)
+                pending.add(future)
+                submitted += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.puzzle_id, future.result()
+
+
+class PuzzlePool:
+    """Keep puzzles generated ahead of time, ready to start a game with.
+
+    There is a pool of puzzles for each (rows, cols, density) asked
+    for. When a pool runs down to the low watermark it is topped up
+    to the high watermark in the background, so taking a puzzle is
+    just taking it off the pool. Only the most recently used
+    max_configs pools are kept; older ones are dropped.
+
+    Attributes:
+        low         - Top a pool up when it has this many puzzles or fewer
+        high        - How many puzzles to top a pool up to
+        max_configs - How many pools to keep
+        executor    - Where puzzles are generated
+        own         - True if the pool made the executor, and so shuts it down
+        pools       - An OrderedDict from (rows, cols, density) to a deque
+                      of ready Boards, least recently used first
+        pending     - For each (rows, cols, density) with a pool, how
+                      many puzzles are being generated for that pool
+        lock        - Guards pools and pending, which the executor's
+                      threads add to
+        hits        - How many puzzles were taken ready from a pool
+        misses      - How many times a pool was empty
+    """
+    __slots__ = ('low', 'high', 'max_configs', 'executor', 'own', 'pools', 'pending', 'lock', 'hits', 'misses')
+
+    def __init__(self, low=2, high=8, max_configs=8, executor=None):
+        if low >= high:
+            raise ValueError("the low watermark %d must be below the high watermark %d" % (low, high))
+        self.low = low
+        self.high = high
+        self.max_configs = max_configs
+        self.own = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.pools = OrderedDict()
+        self.pending = {}
+        # Reentrant, because a future that is already done runs its
+        # callback, which takes the lock, as soon as it is added
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def warm(self, rows, cols, density=40):
+        """Start filling the pool for a size of board up to the high watermark."""
+        with self.lock:
+            self._pool(rows, cols, density)
+            self._refill((rows, cols, density))
+
+    def take(self, rows, cols, density=40):
+        """Take a ready puzzle, without waiting for one.
+
+        Returns:
+            A Board with exactly one solution, or None if the pool is
+            empty. Either way the pool is topped up if it is low.
+        """
+        key = (rows, cols, density)
+        with self.lock:
+            pool = self._pool(rows, cols, density)
+            board = pool.popleft() if pool else None
+            if board is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if len(pool) <= self.low:
+                self._refill(key)
+        return board
+
+    def get(self, rows, cols, density=40):
+        """Take a ready puzzle, or generate one now if there are none.
+
+        Returns:
+            A Board with exactly one solution
+        """
+        board = self.take(rows, cols, density)
+        if board is None:
+            board = generate_one(random.randrange(2 ** 32), rows, cols, density)
+        return board
+
+    def ready(self, rows, cols, density=40):
+        """How many puzzles are ready for a size of board."""
+        with self.lock:
+            pool = self.pools.get((rows, cols, density))
+            return len(pool) if pool else 0
+
+    def close(self):
+        """Stop generating puzzles, and shut down the executor if the pool made it."""
+        if self.own:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def _pool(self, rows, cols, density):
+        # The pool for a size of board, made if need be, as the most
+        # recently used one. Call with the lock held.
+        key = (rows, cols, density)
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = deque()
+            while len(self.pools) > self.max_configs:
+                self.pending.pop(self.pools.popitem(last=False)[0], None)
+        else:
+            self.pools.move_to_end(key)
+        return pool
+
+    def _refill(self, key):
+        # Generate enough puzzles to bring a pool up to the high
+        # watermark, counting the ones already on the way. Call with
+        # the lock held.
+        pool = self.pools[key]
+        for i in range(self.high - len(pool) - self.pending.get(key, 0)):
+            self.pending[key] = self.pending.get(key, 0) + 1
+            future = self.executor.submit(generate_one, random.randrange(2 ** 32), *key)
+            future.add_done_callback(lambda future, key=key, pool=pool: self._add(key, pool, future))
+
+    def _add(self, key, pool, future):
+        # A puzzle has been generated: add it to its pool, unless the
+        # pool was evicted or the executor was shut down in the meantime.
+        # An evicted pool's count went with it, and a new pool for the
+        # same key counts only its own puzzles.
+        with self.lock:
+            if self.pools.get(key) is not pool:
+                return
+            self.pending[key] -= 1
+            if future.cancelled() or future.exception() is not None:
+                return
+            if len(pool) < self.high:
+                pool.append(future.result())
+
+
+def stream_puzzles(rows, cols, density=40, seed=None, stages=(), build=False):
+    """Make puzzles, one at a time, for as long as they are asked for.
+
+    Nothing is made until the next puzzle is asked for, and nothing
+    is kept after it is handed over, so a slow consumer never has a
+    growing pile of puzzles waiting and memory use stays the same
+    however many puzzles are streamed.
+
+    Each candidate board goes through the stages in turn. A stage is
+    called with a (puzzle, solution, metadata) item and returns the
+    item to pass on, or None to drop it. keep_unique(), keep_solvable()
+    and keep_difficulty() make filtering stages. The last stage can
+    also turn the item into something else, such as the bytes
+    tree_game_pack.pack_board() makes, to stream straight to a file.
+
+    Args:
+        rows    - The number of rows on each board
+        cols    - The number of cols on each board
+        density - The density of trees as a percentage (0-100)
+        seed    - Optional, candidate n is made from seed + n
+        stages  - The stages to put each candidate through
+        build   - If True, make candidates with build_puzzle(),
+                  which are always uniquely solvable, instead of
+                  create_board()
+
+    Returns:
+        An endless generator of (puzzle, solution, metadata) items,
+        or whatever the stages turned them into. The puzzle is a
+        Board of just the trees, the solution has the tents too, and
+        metadata is a dict with the rows, cols, density and seed of
+        the board. Stages may add to it.
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    make = tree_game_lib.build_puzzle if build else tree_game_lib.create_board
+
+    for n in itertools.count(seed):
+        solution = make(rows, cols, density=density, rng=random.Random(n))
+        item = (tree_game_lib.create_guess_board(solution), solution,
+                {'rows': rows, 'cols': cols, 'density': density, 'seed': n})
+        for stage in stages:
+            item = stage(item)
+            if item is None:
+                break
+        else:
+            yield item
+
+
+def keep_unique(item):
+    """A stage for stream_puzzles() that drops puzzles without exactly one solution.
+
+    Adds 'stats', the SolverStats of the check, to the metadata.
+    """
+    puzzle, solution, metadata = item
+    stats = tree_game_lib.SolverStats()
+    if tree_game_lib.quick_reject(solution) is not None or \
+            tree_game_lib.count_solutions(solution, stats=stats) != 1:
+        return None
+    metadata['stats'] = stats
+    return item
+
+
+def keep_solvable(item):
+    """A stage for stream_puzzles() that drops puzzles the rules cannot solve without guessing.
+
+    Adds 'stats', the SolverStats of the check, to the metadata.
+    """
+    puzzle, solution, metadata = item
+    stats = tree_game_lib.SolverStats()
+    if tree_game_lib.solve_by_deduction(solution, stats=stats) is None:
+        return None
+    metadata['stats'] = stats
+    return item
+
+
+def keep_difficulty(low, high):
+    """Make a stage for stream_puzzles() that keeps puzzles of a difficulty.
+
+    Put it after keep_unique() or keep_solvable(), so it can grade
+    the puzzle from the stats they saved instead of solving it again.
+
+    Args:
+        low  - The lowest grade_puzzle() score to keep
+        high - The highest score to keep
+
+    Returns:
+        The stage, which adds 'difficulty' to the metadata
+    """
+    def stage(item):
+        puzzle, solution, metadata = item
+        score = tree_game_lib.grade_puzzle(solution, stats=metadata.get('stats'))
+        if score < low or score > high:
+            return None
+        metadata['difficulty'] = score
+        return item
+    return stage
+
+
+def batched(items, size):
+    """Group a stream into lists of up to size items.
+
+    Only one batch is held at a time, so a writer can take a batch,
+    write it out, and ask for the next at its own pace.
+
+    Returns:
+        A generator of lists
+    """
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, size))
+        if not batch:
+            return
+        yield batch
+
+
+if __name__ == '__main__':
+    for name, board in generate_puzzles(8, 10, 10):
+        print(name)
+        tree_game_lib.print_board(board)
+        print()
@@ -1,5 +1,15 @@
+import itertools
 import random
-import msvcrt
+import sys
+import time
+from array import array
+from collections import deque
+
+try:
+    import msvcrt
+except ImportError:
+    # Not on Windows, so play() reads whole lines instead of key presses
+    msvcrt = None
 
 BOARD_TENT = "^"
 BOARD_TREE = "Ŷ"
@@ -10,10 +20,383 @@ BOARD_BORDER_COL = "│"
 BOARD_BORDER_ROW = "-"
 
 
-class OutOfRange(BaseException):
+# Compact integer codes for the squares of a Board. The BOARD_*
+# characters above are what the rest of the game (and the player)
+# sees, these are what is actually stored.
+CELL_EMPTY = 0
+CELL_TENT = 1
+CELL_TREE = 2
+CELL_EMPTY_GUESS = 3
+CELL_OUT_OF_BOUNDS = 4
+
+CELL_TO_BOARD = (BOARD_EMPTY, BOARD_TENT, BOARD_TREE, BOARD_EMPTY_GUESS, BOARD_OUT_OF_BOUNDS)
+BOARD_TO_CELL = {square: cell for cell, square in enumerate(CELL_TO_BOARD)}
+
+# For bytes.translate(): 1 for a tent and 0 for anything else
+TENT_MASK = bytes(cell == CELL_TENT for cell in range(256))
+
+
+class OutOfRange(Exception):
     pass
 
 
+class Board:
+    """A game board stored as one flat bytearray of cell codes.
+
+    A list of lists of one character strings costs a pointer per
+    square plus a list per row. A Board keeps one byte per square
+    instead, so thousands of large boards fit in memory at once.
+
+    For compatibility with the list of lists boards the rest of the
+    game grew up with, board[row][col] reads and writes the BOARD_*
+    characters through a BoardRow view, and len(board) and
+    len(board[0]) are the number of rows and cols.
+
+    The board is surrounded by a ring of CELL_OUT_OF_BOUNDS squares.
+    Looking at a neighbour of any square on the board is then just
+    cells[index + offset], with no bounds check and no exception,
+    even along the edges.
+
+    The board also keeps count of how many squares of each kind are
+    in each row and col, so counting tents is a lookup rather than a
+    scan. To keep those counts right, change squares with put() (or
+    set_cell(), set() or board[row][col] = ...), not by writing to
+    cells directly.
+
+    Attributes:
+        rows       - The number of rows on the board
+        cols       - The number of cols on the board
+        stride     - The distance in cells between two rows
+        cells      - The bytearray of CELL_* codes, including the ring
+        row_start  - The index in cells of col 0 of each row
+        adjacent   - The offsets of the 4 squares next to a square
+        around     - The offsets of the 3x3 block centred on a square
+        row_counts - row_counts[cell][row] is the number of squares
+                     holding cell in row
+        col_counts - col_counts[cell][col] is the number of squares
+                     holding cell in col
+    """
+    __slots__ = ('rows', 'cols', 'stride', 'cells', 'row_start', 'adjacent', 'around', 'row_counts', 'col_counts')
+
+    def __init__(self, rows, cols, fill=CELL_EMPTY):
+        self.rows = rows
+        self.cols = cols
+        self.stride = stride = cols + 2
+        self.cells = bytearray([CELL_OUT_OF_BOUNDS]) * ((rows + 2) * stride)
+        self.row_start = tuple(range(stride + 1, (rows + 1) * stride, stride))
+        self.adjacent = (-stride, -1, 1, stride)
+        self.around = tuple(r * stride + c for r in [-1, 0, 1] for c in [-1, 0, 1])
+        for start in self.row_start:
+            self.cells[start:start + cols] = bytes([fill]) * cols
+        self.recount()
+
+    @classmethod
+    def from_lists(cls, squares):
+        """Build a Board from a list of lists of BOARD_* characters.
+
+        Args:
+            squares - A list of lists board
+
+        Returns:
+            A new Board with the same contents
+        """
+        rows = len(squares)
+        cols = len(squares[0]) if rows else 0
+        board = cls(rows, cols)
+        for row in range(rows):
+            start = board.row_start[row]
+            board.cells[start:start + cols] = bytes(BOARD_TO_CELL[square] for square in squares[row])
+        board.recount()
+        return board
+
+    def to_lists(self):
+        """Convert the board back into a list of lists of BOARD_* characters."""
+        return [[CELL_TO_BOARD[cell] for cell in self.cells[start:start + self.cols]] for start in self.row_start]
+
+    def copy(self):
+        """Make an independent copy of the board."""
+        board = Board.__new__(Board)
+        board.rows = self.rows
+        board.cols = self.cols
+        board.stride = self.stride
+        board.cells = bytearray(self.cells)
+        board.row_start = self.row_start
+        board.adjacent = self.adjacent
+        board.around = self.around
+        board.row_counts = [array('i', counts) for counts in self.row_counts]
+        board.col_counts = [array('i', counts) for counts in self.col_counts]
+        return board
+
+    def recount(self):
+        """Rebuild row_counts and col_counts from scratch.
+
+        Only needed after writing to cells directly.
+        """
+        cells = self.cells
+        stride = self.stride
+        first = self.row_start[0]
+        self.row_counts = [array('i', [0]) * self.rows for cell in CELL_TO_BOARD]
+        self.col_counts = [array('i', [0]) * self.cols for cell in CELL_TO_BOARD]
+        for cell in range(len(CELL_TO_BOARD)):
+            code = bytes([cell])
+            counts = self.row_counts[cell]
+            for row, start in enumerate(self.row_start):
+                counts[row] = cells.count(code, start, start + self.cols)
+            counts = self.col_counts[cell]
+            for col in range(self.cols):
+                counts[col] = cells[first + col:first + col + self.rows * stride:stride].count(code)
+
+    def put(self, index, cell):
+        """Change the CELL_* code at an index in cells, keeping the counts right."""
+        old = self.cells[index]
+        if old == cell:
+            return
+        self.cells[index] = cell
+        row, col = divmod(index - self.row_start[0], self.stride)
+        self.row_counts[old][row] -= 1
+        self.row_counts[cell][row] += 1
+        self.col_counts[old][col] -= 1
+        self.col_counts[cell][col] += 1
+
+    def in_bounds(self, row, col):
+        """Is row,col a square on the board?"""
+        return 0 <= row < self.rows and 0 <= col < self.cols
+
+    def index(self, row, col):
+        """The index in cells of the square at row,col."""
+        return self.row_start[row] + col
+
+    def get_cell(self, row, col):
+        """The CELL_* code of the square at row,col."""
+        return self.cells[self.row_start[row] + col]
+
+    def set_cell(self, row, col, cell):
+        """Change the CELL_* code of the square at row,col."""
+        self.put(self.row_start[row] + col, cell)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += self.rows
+        if row < 0 or row >= self.rows:
+            raise IndexError("row of %d is outside range 0..%d" % (row, self.rows - 1))
+        return BoardRow(self, row)
+
+    def __iter__(self):
+        for row in range(self.rows):
+            yield BoardRow(self, row)
+
+
+class JournalBoard(Board):
+    """A Board that remembers its changes, so they can be taken back.
+
+    Every put() is written down in changes. snapshot() names the
+    board as it is now, and rollback() takes back every change made
+    since, so returning to an earlier board costs as much as the
+    changes made since then, not a copy of the whole board. A search
+    can branch and backtrack on one JournalBoard, and a player can
+    undo and redo moves.
+
+    copy() makes a plain Board, without the journal.
+
+    Attributes:
+        changes - (index, old cell, new cell) for every change made,
+                  oldest first
+        undone  - The groups of changes rollback() took back, most
+                  recent last, for redo(). Forgotten on the next change.
+    """
+    __slots__ = ('changes', 'undone')
+
+    def __init__(self, rows, cols, fill=CELL_EMPTY):
+        Board.__init__(self, rows, cols, fill=fill)
+        self.changes = []
+        self.undone = []
+
+    @classmethod
+    def from_board(cls, board):
+        """Make a JournalBoard copy of a Board or a list of lists board."""
+        copy = as_board(board).copy()
+        journal = cls.__new__(cls)
+        for name in Board.__slots__:
+            setattr(journal, name, getattr(copy, name))
+        journal.changes = []
+        journal.undone = []
+        return journal
+
+    def put(self, index, cell):
+        old = self.cells[index]
+        if old == cell:
+            return
+        self.changes.append((index, old, cell))
+        if self.undone:
+            self.undone.clear()
+        self.write(index, cell)
+
+    def write(self, index, cell):
+        """Change a square without writing the change down."""
+        Board.put(self, index, cell)
+
+    def snapshot(self):
+        """Name the board as it is now, for rollback()."""
+        return len(self.changes)
+
+    def rollback(self, snapshot):
+        """Take back every change made since snapshot() returned snapshot.
+
+        Returns:
+            none
+        """
+        changes = self.changes
+        if len(changes) <= snapshot:
+            return
+        group = changes[snapshot:]
+        del changes[snapshot:]
+        for index, old, cell in reversed(group):
+            self.write(index, old)
+        self.undone.append(group)
+
+    def redo(self):
+        """Make the changes the last rollback() took back again.
+
+        Returns:
+            True  - They were made again
+            False - There was nothing to redo
+        """
+        if not self.undone:
+            return False
+        group = self.undone.pop()
+        for index, old, cell in group:
+            self.write(index, cell)
+        self.changes.extend(group)
+        return True
+
+
+class GuessBoard(JournalBoard):
+    """A player's guess board that always knows whether it is solved.
+
+    It keeps count of the squares where the guess and the board
+    disagree about a tent, and updates the count on every change,
+    undo and redo included. Checking for a win after a move is then
+    a lookup rather than a scan of the whole board.
+
+    Attributes:
+        answer - One byte per cell, 1 where the board has a tent
+        wrong  - How many squares have a tent on only one of the
+                 guess and the board
+    """
+    __slots__ = ('answer', 'wrong')
+
+    @classmethod
+    def from_puzzle(cls, board):
+        """Make the guess board for a board, with its tents blanked out.
+
+        Args:
+            board - The board, with its tents
+
+        Returns:
+            A new GuessBoard, like create_guess_board() makes
+        """
+        board = as_board(board)
+        guess = cls.from_board(create_guess_board(board))
+        guess.answer = board.cells.translate(TENT_MASK)
+        guess.wrong = sum(board.row_counts[CELL_TENT])
+        return guess
+
+    def write(self, index, cell):
+        was = self.cells[index] == CELL_TENT
+        JournalBoard.write(self, index, cell)
+        if was != (cell == CELL_TENT):
+            if was == bool(self.answer[index]):
+                self.wrong += 1
+            else:
+                self.wrong -= 1
+
+    def is_solved(self):
+        """Does the guess have exactly the tents of the board?"""
+        return self.wrong == 0
+
+
+class BoardRow:
+    """A view of one row of a Board that reads and writes BOARD_* characters."""
+    __slots__ = ('board', 'start')
+
+    def __init__(self, board, row):
+        self.board = board
+        self.start = board.row_start[row]
+
+    def _index(self, col):
+        cols = self.board.cols
+        if col < 0:
+            col += cols
+        if col < 0 or col >= cols:
+            raise IndexError("col of %d is outside range 0..%d" % (col, cols - 1))
+        return self.start + col
+
+    def __len__(self):
+        return self.board.cols
+
+    def __getitem__(self, col):
+        return CELL_TO_BOARD[self.board.cells[self._index(col)]]
+
+    def __setitem__(self, col, square):
+        self.board.put(self._index(col), BOARD_TO_CELL[square])
+
+    def __iter__(self):
+        cells = self.board.cells
+        for index in range(self.start, self.start + self.board.cols):
+            yield CELL_TO_BOARD[cells[index]]
+
+
+def as_board(board):
+    """Return board as a Board, converting a list of lists if needed.
+
+    Args:
+        board - A Board or a list of lists board
+
+    Returns:
+        board itself if it is already a Board, otherwise a new Board
+        with the same contents.
+    """
+    if isinstance(board, Board):
+        return board
+    return Board.from_lists(board)
+
+
+def store_board(squares, board):
+    """Copy the contents of a Board back into a list of lists board.
+
+    Functions that work on a Board internally use this to hand their
+    results back to callers that passed in a list of lists.
+
+    Args:
+        squares - The list of lists board to change
+        board   - The Board to copy from
+
+    Returns:
+        none
+    """
+    cells = board.cells
+    for row in range(board.rows):
+        start = board.row_start[row]
+        squares[row][:] = [CELL_TO_BOARD[cell] for cell in cells[start:start + board.cols]]
+
+
+def copy_board(board):
+    """Make an independent copy of a board.
+
+    Args:
+        board - A Board or a list of lists board
+
+    Returns:
+        A copy of the same kind as board
+    """
+    if isinstance(board, Board):
+        return board.copy()
+    return [list(row) for row in board]
+
+
 def validate(board, row=None, col=None):
     """Validate that row and col are within the board boundaries.
 
@@ -35,13 +418,29 @@ def validate(board, row=None, col=None):
     if row is None and col is None:
         raise OutOfRange("Either row or col must be set")
 
-    if row:
-        if row > len(board) - 1 or row < 0:
-            raise OutOfRange("row of %d is outside range 0..%d" % (row, len(board) - 1))
+    rows, cols = dimensions(board)
 
-    if col:
-        if col > len(board[0]) - 1 or col < 0:
-            raise OutOfRange("col of %d is outside range 0..%d" % (col, len(board[0]) - 1))
+    if row is not None:
+        if row > rows - 1 or row < 0:
+            raise OutOfRange("row of %d is outside range 0..%d" % (row, rows - 1))
+
+    if col is not None:
+        if col > cols - 1 or col < 0:
+            raise OutOfRange("col of %d is outside range 0..%d" % (col, cols - 1))
+
+
+def dimensions(board):
+    """The number of rows and cols on a board.
+
+    Args:
+        board - A Board or a list of lists board
+
+    Returns:
+        (rows, cols)
+    """
+    if isinstance(board, Board):
+        return board.rows, board.cols
+    return len(board), len(board[0]) if board else 0
 
 
 def get(board, row, col):
@@ -66,10 +465,16 @@ def get(board, row, col):
         If row,col is outside the board:
             BOARD_OUT_OF_RANGE
     """
+    # Compare instead of calling validate(). Neighbour scans ask
+    # about squares off the edge of the board all the time, and
+    # raising and catching OutOfRange for each one is slow.
+    if isinstance(board, Board):
+        if 0 <= row < board.rows and 0 <= col < board.cols:
+            return CELL_TO_BOARD[board.cells[board.row_start[row] + col]]
+        return BOARD_OUT_OF_BOUNDS
+
     # The coordinates are out of bounds
-    try:
-        validate(board, row, col)
-    except OutOfRange:
+    if row < 0 or row >= len(board) or col < 0 or col >= len(board[row]):
         return BOARD_OUT_OF_BOUNDS
 
     return board[row][col]
@@ -95,16 +500,40 @@ def set(board, row, col, val):
     Returns:
         none
     """
+    if isinstance(board, Board):
+        if 0 <= row < board.rows and 0 <= col < board.cols:
+            board.put(board.row_start[row] + col, BOARD_TO_CELL[val])
+        return
+
     # The coordinates are out of bounds
-    try:
-        validate(board, row, col)
-    except OutOfRange:
+    if row < 0 or row >= len(board) or col < 0 or col >= len(board[row]):
         return
 
     board[row][col] = val
 
 
-def percent_chance(percent):
+def as_rng(rng=None):
+    """Turn a seed or a random number generator into a random number generator.
+
+    Every function that makes random choices takes an rng argument
+    and passes it through here, so callers can hand in a seed, their
+    own random.Random, or nothing at all.
+
+    Args:
+        rng - None to use the random module's shared generator, an
+              int seed for a new random.Random, or a random.Random
+
+    Returns:
+        Something with the random.Random methods
+    """
+    if rng is None:
+        return random
+    if isinstance(rng, int):
+        return random.Random(rng)
+    return rng
+
+
+def percent_chance(percent, rng=None):
     """Given a probability percent, roll a die and see whether an event happened.
 
     Given the probability that something will happen, roll a 100-sided
@@ -116,12 +545,13 @@ def percent_chance(percent):
         percent - The percent chance the event will happen.
             0   = It will never happen
             100 = It will always happen
+        rng     - Optional, the random number generator to roll with
 
     Returns:
         True  - The event happened
         False - The event did not happen
     """
-    return random.randint(1, 100) <= percent
+    return as_rng(rng).randint(1, 100) <= percent
 
 
 def is_tent(board, row, col):
@@ -144,6 +574,9 @@ def count_tents(board, row=None, col=None, match=BOARD_TENT):
     that are present. Only one (row or col) can be
     asked for at a time.
 
+    A Board keeps these counts up to date as squares change,
+    so for a Board this is a lookup instead of a scan.
+
     Args:
         board - The board
         row   - If set, the index of the row to count
@@ -158,6 +591,11 @@ def count_tents(board, row=None, col=None, match=BOARD_TENT):
     """
     validate(board, row=row, col=col)
 
+    if isinstance(board, Board):
+        if row is not None:
+            return board.row_counts[BOARD_TO_CELL[match]][row]
+        return board.col_counts[BOARD_TO_CELL[match]][col]
+
     tents = 0
 
     if row is not None:
@@ -173,7 +611,137 @@ def count_tents(board, row=None, col=None, match=BOARD_TENT):
         return tents
 
 
-def print_board(board, guess=None, cursor=None):
+ANSI_REVERSE = chr(27) + "[7m"
+ANSI_NORMAL = chr(27) + "[0m"
+ANSI_CLEAR = chr(27) + "[H" + chr(27) + "[2J"
+ANSI_CLEAR_BELOW = chr(27) + "[J"
+
+
+def ansi_move(line, col):
+    """The ANSI escape that moves the terminal cursor to line,col (both from 1)."""
+    return chr(27) + "[%d;%dH" % (line, col)
+
+
+class BoardRenderer:
+    """Draw a board to the terminal, redrawing only what changed.
+
+    The tent counts along the top and the side never change, so they
+    are worked out once. The first call to draw() clears the screen
+    and writes the whole frame; after that it only moves the terminal
+    cursor to the squares that changed (including the old and new
+    position of the player's cursor) and rewrites those. A message
+    for the player goes below the board, as part of the frame, and
+    replaces the one before it. Each frame goes out in a single write.
+
+    Attributes:
+        board  - The board, with its tents
+        out    - Where to write, default sys.stdout
+        header - The lines above the board: the col counts and border
+        gutter - The text after each row: the border and the row count
+        shown  - The squares on the screen, as bytes of CELL_* codes,
+                 or None if the next draw() has to redraw everything
+        cursor - The square the cursor is shown on
+    """
+    __slots__ = ('board', 'out', 'header', 'gutter', 'shown', 'cursor')
+
+    def __init__(self, board, out=None):
+        self.board = as_board(board)
+        self.out = out
+        row_tents, col_tents = clues(self.board)
+        border_row = " " + BOARD_BORDER_ROW * self.board.cols
+        self.header = [" " + "".join("%s" % tents for tents in col_tents), border_row]
+        self.gutter = [BOARD_BORDER_COL + " " + ("%s" % tents) for tents in row_tents]
+        self.shown = None
+        self.cursor = None
+
+    def square(self, cells, index, highlight):
+        if highlight:
+            return ANSI_REVERSE + CELL_TO_BOARD[cells[index]] + ANSI_NORMAL
+        return CELL_TO_BOARD[cells[index]]
+
+    def frame(self, guess=None, cursor=None):
+        """The whole board as text, the way print_board() prints it.
+
+        Args:
+            guess  - Optional, the player's guesses to show instead
+                     of the board's own tents
+            cursor - Optional, [row, col] of the square to highlight
+
+        Returns:
+            The lines of the frame, each ending with a newline
+        """
+        board = self.board
+        cells = as_board(guess).cells if guess else board.cells
+        cursor = cursor or [-1, -1]
+
+        lines = list(self.header)
+        for row in range(board.rows):
+            start = board.row_start[row]
+            if row == cursor[0] and 0 <= cursor[1] < board.cols:
+                squares = "".join(self.square(cells, start + col, col == cursor[1]) for col in range(board.cols))
+            else:
+                squares = "".join(CELL_TO_BOARD[cell] for cell in cells[start:start + board.cols])
+            lines.append(BOARD_BORDER_COL + squares + self.gutter[row])
+        lines.append(self.header[1])
+        return "\n".join(lines) + "\n"
+
+    def draw(self, guess=None, cursor=None, message=''):
+        """Bring the terminal up to date with guess and cursor.
+
+        Leaves the terminal cursor on the line after the message, with
+        anything below it cleared.
+
+        Args:
+            guess   - Optional, the player's guesses to show instead
+                      of the board's own tents
+            cursor  - Optional, [row, col] of the square to highlight
+            message - Optional, text to show below the board
+
+        Returns:
+            none
+        """
+        board = self.board
+        cells = as_board(guess).cells if guess else board.cells
+        cursor = list(cursor) if cursor else [-1, -1]
+        message = message.rstrip('\n') + '\n' if message else ''
+
+        if self.shown is None:
+            text = ANSI_CLEAR + self.frame(guess, cursor) + message
+        else:
+            changed = []
+            for row in range(board.rows):
+                start = board.row_start[row]
+                if cells[start:start + board.cols] != self.shown[start:start + board.cols]:
+                    for index in range(start, start + board.cols):
+                        if cells[index] != self.shown[index]:
+                            changed.append(index)
+            if cursor != self.cursor:
+                for row, col in [self.cursor, cursor]:
+                    if board.in_bounds(row, col):
+                        changed.append(board.row_start[row] + col)
+
+            # The board starts after the header lines, one col in
+            pieces = []
+            first = board.row_start[0]
+            for index in changed:
+                row, col = divmod(index - first, board.stride)
+                pieces.append(ansi_move(len(self.header) + row + 1, col + 2))
+                pieces.append(self.square(cells, index, [row, col] == cursor))
+            pieces.append(ansi_move(len(self.header) + board.rows + 2, 1) + ANSI_CLEAR_BELOW + message)
+            text = "".join(pieces)
+
+        self.shown = bytes(cells)
+        self.cursor = cursor
+        out = self.out or sys.stdout
+        out.write(text)
+        out.flush()
+
+    def reset(self):
+        """Make the next draw() redraw everything, after something else was printed."""
+        self.shown = None
+
+
+def print_board(board, guess=None, cursor=None, out=None):
     """Print the board.
 
     Print the board, including the tent counts along
@@ -184,45 +752,19 @@ def print_board(board, guess=None, cursor=None):
     completed it so far, but still also include the
     tent counts from the actual board.
 
+    The whole board is built up first and written in
+    one go.
+
     Args:
-        board - The board
-        guess - The player's guesses
+        board  - The board
+        guess  - The player's guesses
+        cursor - Optional, [row, col] of the square to highlight
+        out    - Optional, where to write, default sys.stdout
 
     Returns:
         none
     """
-    # If we are not using a cursor, move it off the board
-    cursor = cursor or [-1, -1]
-
-    # Print the number of tents in each column
-    record = " "
-    for col in range(len(board[0])):
-        record += ("%s" % count_tents(board, col=col))
-    print(record)
-
-    # Print the board's top border
-    border_row = " "
-    for col in range(len(board[0])):
-        border_row += BOARD_BORDER_ROW
-    print(border_row)
-
-    # Print each row, with borders and tent count
-    for row in range(len(board)):
-        record = BOARD_BORDER_COL
-        for col in range(len(board[row])):
-            if row == cursor[0] and col == cursor[1]:
-                record += chr(27) + "[7m"
-            if guess:
-                record += guess[row][col]
-            else:
-                record += board[row][col]
-            if row == cursor[0] and col == cursor[1]:
-                record += chr(27) + "[0m"
-        record += BOARD_BORDER_COL + " " + ("%s" % count_tents(board, row=row))
-        print(record)
-
-    # Print the board's bottom border
-    print(border_row)
+    (out or sys.stdout).write(BoardRenderer(board).frame(guess, cursor))
 
 
 def can_place_tent(board, row, col):
@@ -242,10 +784,26 @@ def can_place_tent(board, row, col):
         True  - It is not illegal to place a tent at row,col
         False - It is illegal to place a tent at row,col
     """
+    if isinstance(board, Board):
+        if not board.in_bounds(row, col):
+            return False
+
+        # There is already something in this square
+        cells = board.cells
+        index = board.row_start[row] + col
+        if cells[index] != CELL_EMPTY:
+            return False
+
+        # There is a tent in this or any adjacent square
+        for offset in board.around:
+            if cells[index + offset] == CELL_TENT:
+                return False
+
+        return True
+
     # The coordinates are out of bounds
-    try:
-        validate(board, row, col)
-    except OutOfRange:
+    rows, cols = dimensions(board)
+    if row < 0 or row >= rows or col < 0 or col >= cols:
         return False
 
     # There is already something in this square
@@ -262,7 +820,7 @@ def can_place_tent(board, row, col):
     return True
 
 
-def place_tree_and_tent(board, row, col):
+def place_tree_and_tent(board, row, col, rng=None):
     """Put a tree and its tent on the board.
 
     Given a coordinate on the board, find an adjacent square that can
@@ -274,6 +832,7 @@ def place_tree_and_tent(board, row, col):
         board - The game board
         row   - The index of a row on the board
         col   - The index of a col on the board
+        rng   - Optional, the random number generator to choose with
 
     Returns:
         none
@@ -293,17 +852,18 @@ def place_tree_and_tent(board, row, col):
         return
 
     # Randomly select one of the choices
-    choice = random.randint(0, len(choices)-1)
+    choice = as_rng(rng).randint(0, len(choices)-1)
     r = choices[choice][0]
     c = choices[choice][1]
     board[r][c] = BOARD_TENT
     board[row][col] = BOARD_TREE
 
 
-def create_board(rows, cols, density=30):
+def create_board(rows, cols, density=30, rng=None):
     """Create and populate a new board.
 
-    A board is a list of lists of the form:
+    A board is a Board, which can be read like a list of lists
+    of the form:
     [
         [ tree, empty, tent ],
         [ tent, empty, tree ]
@@ -313,20 +873,20 @@ def create_board(rows, cols, density=30):
         rows    - The number of rows to put in the board
         cols    - The number of cols to put in the board
         density - The density of trees as a percentage (0-100)
+        rng     - Optional, a seed or random number generator. The
+                  same seed always creates the same board.
 
     Returns:
-        A new board (a list of lists) consisting of trees,
-        their associated tents, and the remaining squares
-        marked as empty.
+        A new Board consisting of trees, their associated tents,
+        and the remaining squares marked as empty.
     """
-    board = []
-    for r in range(rows):
-        board.append([BOARD_EMPTY] * cols)
+    rng = as_rng(rng)
+    board = Board(rows, cols)
 
-    for row in range(len(board)):
-        for col in range(len(board[row])):
-            if percent_chance(density):
-                place_tree_and_tent(board, row, col)
+    for row in range(rows):
+        for col in range(cols):
+            if percent_chance(density, rng=rng):
+                place_tree_and_tent(board, row, col, rng=rng)
 
     return board
 
@@ -340,236 +900,1907 @@ def create_guess_board(board):
     player can guess where they are.
 
     Args:
-        board - The board to copy
+        board - The board to copy, either a Board or a list of lists
 
     Returns:
-        A copy of the board, but with any tents replaced
+        A Board copy of the board, but with any tents replaced
         with empty.
     """
-    guess = []
-    for row in range(len(board)):
-        guess.append([BOARD_EMPTY] * len(board[row]))
-
-    for row in range(len(guess)):
-        for col in range(len(guess[row])):
-            if board[row][col] == BOARD_TENT:
-                guess[row][col] = BOARD_EMPTY
-            else:
-                guess[row][col] = board[row][col]
+    guess = board.copy() if isinstance(board, Board) else Board.from_lists(board)
+    guess.cells = guess.cells.replace(bytes([CELL_TENT]), bytes([CELL_EMPTY]))
+    guess.recount()
 
     return guess
 
 
 def solved(board, guess):
-    for row in range(len(board)):
-        for col in range(len(board[row])):
-            if get(board, row, col) == BOARD_TENT:
-                if get(guess, row, col) != BOARD_TENT:
-                    return False
-            else:
-                if get(guess, row, col) == BOARD_TENT:
-                    return False
+    """Does guess have exactly the tents of board?
+
+    Args:
+        board - The board, with its tents
+        guess - The player's guesses, the same size as board
+
+    Returns:
+        True if every tent is in the right place and there are no others
+    """
+    board = as_board(board)
+    guess = as_board(guess)
+    if board.row_counts[CELL_TENT] != guess.row_counts[CELL_TENT]:
+        return False
+    return board.cells.translate(TENT_MASK) == guess.cells.translate(TENT_MASK)
+
+
+def solved_each(boards, guesses):
+    """Check many guesses against their boards at once.
+
+    The tents of all the boards are compared in one go; only when
+    some guess is wrong are the boards compared one by one.
+
+    Args:
+        boards  - A list of boards, with their tents
+        guesses - A list of guesses, one per board
+
+    Returns:
+        A list of bools, True where the guess solves its board
+    """
+    boards = [as_board(board) for board in boards]
+    guesses = [as_board(guess) for guess in guesses]
+    if b''.join(board.cells for board in boards).translate(TENT_MASK) == \
+            b''.join(guess.cells for guess in guesses).translate(TENT_MASK):
+        return [True] * len(boards)
+    return [solved(board, guess) for board, guess in zip(boards, guesses)]
 
-    return True
+
+def clues(board):
+    """The number of tents in each row and each col of a board.
+
+    These are the numbers printed along the side and the top of
+    the board, the clues the player solves the puzzle from.
+
+    Args:
+        board - The board, with its tents
+
+    Returns:
+        (row_tents, col_tents) - Two lists of tent counts
+    """
+    rows, cols = dimensions(board)
+    return ([count_tents(board, row=row) for row in range(rows)],
+            [count_tents(board, col=col) for col in range(cols)])
 
 
 def fill_empty(board, guess):
+    """Mark the squares of guess that obviously cannot hold a tent.
+
+    Args:
+        board - The board, with its tents
+        guess - The player's guesses, changed in place
+
+    Returns:
+        none
+    """
+    if not isinstance(guess, Board):
+        work = Board.from_lists(guess)
+        fill_empty(board, work)
+        store_board(guess, work)
+        return
+
+    row_tents, col_tents = clues(board)
+    cells = guess.cells
+    stride = guess.stride
+
     # If the row has all its tents, the remaining squares must be empty
-    for row in range(len(guess)):
-        need = count_tents(board, row=row)
-        have = count_tents(guess, row=row)
-        if need == have:
-            for col in range(len(guess[row])):
-                if guess[row][col] == BOARD_EMPTY:
-                    set(guess, row, col, BOARD_EMPTY_GUESS)
+    for row in range(guess.rows):
+        if row_tents[row] == count_tents(guess, row=row):
+            start = guess.row_start[row]
+            for index in range(start, start + guess.cols):
+                if cells[index] == CELL_EMPTY:
+                    guess.put(index, CELL_EMPTY_GUESS)
 
     # If the col has all its tents, the remaining squares must be empty
-    for col in range(len(guess[0])):
-        need = count_tents(board, col=col)
-        have = count_tents(guess, col=col)
-        if need == have:
-            for row in range(len(guess)):
-                if guess[row][col] == BOARD_EMPTY:
-                    set(guess, row, col, BOARD_EMPTY_GUESS)
+    for col in range(guess.cols):
+        if col_tents[col] == count_tents(guess, col=col):
+            start = guess.row_start[0] + col
+            for index in range(start, start + guess.rows * stride, stride):
+                if cells[index] == CELL_EMPTY:
+                    guess.put(index, CELL_EMPTY_GUESS)
 
     # A square that has no trees adjacent to it cannot have a tent
-    for row in range(len(guess)):
-        for col in range(len(guess[row])):
-            if get(guess, row, col) == BOARD_EMPTY:
-                tree = False
-                for adjacent in [[-1, 0], [0, -1], [0, 1], [1, 0]]:
-                    if get(guess, row+adjacent[0], col+adjacent[1]) == BOARD_TREE:
-                        tree = True
-                if not tree:
-                    set(guess, row, col, BOARD_EMPTY_GUESS)
-
-
-def solver(board, guess):
+    adjacent = guess.adjacent
+    for start in guess.row_start:
+        for index in range(start, start + guess.cols):
+            if cells[index] == CELL_EMPTY:
+                for offset in adjacent:
+                    if cells[index + offset] == CELL_TREE:
+                        break
+                else:
+                    guess.put(index, CELL_EMPTY_GUESS)
+
+
+# The names SolverStats and traces use for the solver's rules
+RULES = ['row', 'col', 'tree', 'exclusion', 'pruning', 'matching']
+
+
+class SolverStats:
+    """Counts of what each of the solver's rules did.
+
+    Pass one to solver() or search() to have it filled in. Keeping
+    count costs a couple of additions and a clock read per rule
+    applied, so it is cheap enough to leave on.
+
+    The rules are named in RULES: 'row' and 'col' are the tent
+    counts along the sides, 'tree' is a tree with one empty square
+    left for its tent, 'exclusion' is the squares around a tent,
+    'pruning' is a tent with only one tree, and 'matching' is the
+    TentMatching rule.
+
+    Attributes:
+        examined - For each rule, how many rows, cols or squares it
+                   looked at
+        decided  - For each rule, how many squares it filled in
+        seconds  - For each rule, the time spent applying it
+        steps    - How many items were taken off the worklist
+        rounds   - How many times the worklist ran dry and the
+                   matching rule was tried
+        branches - How many guesses search() had to make
+        depth    - The longest chain of deductions, each needing the
+                   one before it. Rows, cols and squares queued at the
+                   start are at depth 0, and a square decided while
+                   applying a rule to something at depth n is at n + 1.
+    """
+    __slots__ = ('examined', 'decided', 'seconds', 'steps', 'rounds', 'branches', 'depth')
+
+    def __init__(self):
+        self.examined = dict.fromkeys(RULES, 0)
+        self.decided = dict.fromkeys(RULES, 0)
+        self.seconds = dict.fromkeys(RULES, 0.0)
+        self.steps = 0
+        self.rounds = 0
+        self.branches = 0
+        self.depth = 0
+
+    def add(self, other):
+        """Add the counts from another SolverStats into this one."""
+        for rule in RULES:
+            self.examined[rule] += other.examined[rule]
+            self.decided[rule] += other.decided[rule]
+            self.seconds[rule] += other.seconds[rule]
+        self.steps += other.steps
+        self.rounds += other.rounds
+        self.branches += other.branches
+        self.depth = max(self.depth, other.depth)
+
+    def as_dict(self):
+        """The counts as plain dicts and numbers, ready for json.dump()."""
+        return {
+            'steps': self.steps,
+            'rounds': self.rounds,
+            'branches': self.branches,
+            'depth': self.depth,
+            'rules': {rule: {'examined': self.examined[rule], 'decided': self.decided[rule],
+                             'seconds': self.seconds[rule]} for rule in RULES},
+        }
+
+
+class Propagator:
+    """Apply the solver's deduction rules to a guess board, driven by a worklist.
+
+    Instead of sweeping every row, col and square until nothing
+    changes, keep queues of the rows, cols and squares that might
+    have something new to deduce. Changing a square only queues the
+    row and col it is in, the trees next to it, and the square itself
+    if it became a tent. The rules are the same ones solver_sweep()
+    applies:
+
+        - A row or col whose empty squares are exactly the tents it
+          is still missing gets tents in all of them
+        - A tree with no tent next to it and only one empty square
+          next to it gets a tent in that square
+        - The squares around a tent cannot have tents
+        - If a tent has only one tree next to it, the empty squares
+          next to that tree that touch no other tree cannot have tents
+
+    For any guess that agrees with the board, the result is the same
+    as solver_sweep(), in whatever order the rules happen to fire.
+
+    Along the way it also watches for a guess that cannot be right:
+    a row or col with too many or too few tents left, two tents
+    touching, or a tree with no tent and no empty square next to it.
+    When it finds one it sets conflict and stops.
+
+    Attributes:
+        guess      - The Board being solved
+        row_tents  - The number of tents in each row of the solution
+        col_tents  - The number of tents in each col of the solution
+        fill_lines - If True, also apply fill_empty()'s rule that a
+                     row or col with all its tents has no more, every
+                     time a row or col changes instead of once up front
+        matching   - Optional, a TentMatching for guess. Once the
+                     local rules run out, it checks that every tree
+                     can still have its own tent, and rules out the
+                     squares no pairing of trees and tents can use.
+        stats      - Optional, a SolverStats to count into
+        trace      - Optional, called as trace(rule, row, col, cell)
+                     for every square a rule fills in
+        conflict   - True once the guess is known to be impossible
+        rule       - The name of the rule being applied
+        level      - With stats, the depth of what it is being applied to
+        levels     - With stats, the depth of each queued row, col and
+                     square, keyed by ('row', row), ('col', col) or index
+    """
+    __slots__ = ('guess', 'row_tents', 'col_tents', 'fill_lines', 'matching', 'stats', 'trace', 'conflict', 'rule',
+                 'level', 'levels', 'square_queue', 'row_queue', 'col_queue', 'square_queued', 'row_queued',
+                 'col_queued')
+
+    def __init__(self, guess, row_tents, col_tents, fill_lines=False, matching=None, stats=None, trace=None):
+        self.guess = guess
+        self.row_tents = row_tents
+        self.col_tents = col_tents
+        self.fill_lines = fill_lines
+        self.matching = matching
+        self.stats = stats
+        self.trace = trace
+        self.conflict = False
+        self.rule = None
+        self.level = 0
+        self.levels = {}
+        self.square_queue = deque()
+        self.row_queue = deque()
+        self.col_queue = deque()
+        self.square_queued = bytearray(len(guess.cells))
+        self.row_queued = bytearray(guess.rows)
+        self.col_queued = bytearray(guess.cols)
+
+    def reset(self, guess, matching=None):
+        """Empty the queues and start working on another guess board.
+
+        Args:
+            guess    - A Board the same size as the current one
+            matching - Optional, a TentMatching for guess
+
+        Returns:
+            none
+        """
+        for index in self.square_queue:
+            self.square_queued[index] = 0
+        for row in self.row_queue:
+            self.row_queued[row] = 0
+        for col in self.col_queue:
+            self.col_queued[col] = 0
+        self.square_queue.clear()
+        self.row_queue.clear()
+        self.col_queue.clear()
+        self.conflict = False
+        self.level = 0
+        self.levels.clear()
+        self.guess = guess
+        self.matching = matching
+
+    def queue_all(self):
+        """Queue every row, every col, and every tree and tent on the board."""
+        guess = self.guess
+        cells = guess.cells
+        for row in range(guess.rows):
+            self.queue_row(row)
+        for col in range(guess.cols):
+            self.queue_col(col)
+        for start in guess.row_start:
+            for index in range(start, start + guess.cols):
+                if cells[index] == CELL_TREE or cells[index] == CELL_TENT:
+                    self.queue_square(index)
+
+    def queue_row(self, row):
+        if not self.row_queued[row]:
+            self.row_queued[row] = 1
+            self.row_queue.append(row)
+
+    def queue_col(self, col):
+        if not self.col_queued[col]:
+            self.col_queued[col] = 1
+            self.col_queue.append(col)
+
+    def queue_square(self, index):
+        if not self.square_queued[index]:
+            self.square_queued[index] = 1
+            self.square_queue.append(index)
+
+    def assign(self, index, cell):
+        """Change a square and queue everything that depends on it.
+
+        Args:
+            index - The index of the square in guess.cells
+            cell  - The CELL_* code to put there
+
+        Returns:
+            none
+        """
+        guess = self.guess
+        guess.put(index, cell)
+        row, col = divmod(index - guess.row_start[0], guess.stride)
+        if self.stats is not None:
+            self.stats.decided[self.rule] += 1
+            self.deepen(index, row, col, cell)
+        if self.trace is not None:
+            self.trace(self.rule, row, col, cell)
+        self.touch(index)
+
+    def touch(self, index):
+        """Queue everything that depends on a square that has just changed."""
+        guess = self.guess
+        cells = guess.cells
+        row, col = divmod(index - guess.row_start[0], guess.stride)
+        self.queue_row(row)
+        self.queue_col(col)
+        for offset in guess.adjacent:
+            if cells[index + offset] == CELL_TREE:
+                self.queue_square(index + offset)
+        if cells[index] == CELL_TENT:
+            self.queue_square(index)
+
+    def run(self):
+        """Apply the rules until there is nothing left in the queues.
+
+        Returns:
+            True  - Nothing left to deduce
+            False - The guess cannot be right, see conflict
+        """
+        square_queue = self.square_queue
+        row_queue = self.row_queue
+        col_queue = self.col_queue
+        cells = self.guess.cells
+        if self.stats is None and self.trace is None:
+            # Nothing to count, so skip the bookkeeping in apply()
+            apply = lambda rule, check, item: check(item)
+        else:
+            apply = self.apply
+        while not self.conflict:
+            if square_queue:
+                index = square_queue.popleft()
+                self.square_queued[index] = 0
+                if cells[index] == CELL_TREE:
+                    apply('tree', self.check_tree, index)
+                elif cells[index] == CELL_TENT:
+                    apply('exclusion', self.check_exclusion, index)
+                    if not self.conflict:
+                        apply('pruning', self.check_pruning, index)
+            elif row_queue:
+                row = row_queue.popleft()
+                self.row_queued[row] = 0
+                apply('row', self.check_row, row)
+            elif col_queue:
+                col = col_queue.popleft()
+                self.col_queued[col] = 0
+                apply('col', self.check_col, col)
+            elif self.matching is None:
+                return True
+            else:
+                if self.stats is not None:
+                    self.stats.rounds += 1
+                if not apply('matching', self.check_matching, None) and not self.conflict:
+                    return True
+        return False
+
+    def step(self):
+        """Take one row, col or square off the queues and apply the rules to it.
+
+        The same as one time round the loop in run(), for callers that
+        want to stop as soon as something is deduced.
+
+        Returns:
+            ('square', index), ('row', row), ('col', col) or
+            ('matching', None) for what the rules were applied to, or
+            None if there was nothing left to do
+        """
+        cells = self.guess.cells
+        if self.square_queue:
+            index = self.square_queue.popleft()
+            self.square_queued[index] = 0
+            if cells[index] == CELL_TREE:
+                self.apply('tree', self.check_tree, index)
+            elif cells[index] == CELL_TENT:
+                self.apply('exclusion', self.check_exclusion, index)
+                if not self.conflict:
+                    self.apply('pruning', self.check_pruning, index)
+            return 'square', index
+        if self.row_queue:
+            row = self.row_queue.popleft()
+            self.row_queued[row] = 0
+            self.apply('row', self.check_row, row)
+            return 'row', row
+        if self.col_queue:
+            col = self.col_queue.popleft()
+            self.col_queued[col] = 0
+            self.apply('col', self.check_col, col)
+            return 'col', col
+        if self.matching is not None and (self.apply('matching', self.check_matching, None) or self.conflict):
+            return 'matching', None
+        return None
+
+    def apply(self, rule, check, item):
+        """Apply one rule to one row, col or square, keeping count if asked to.
+
+        Returns:
+            Whatever the rule's check returned
+        """
+        self.rule = rule
+        stats = self.stats
+        if stats is None:
+            return check(item)
+        if rule == 'row' or rule == 'col':
+            self.level = self.levels.pop((rule, item), 0)
+        elif rule == 'matching':
+            # The matching looks at the whole board
+            self.level = stats.depth
+        elif rule != 'pruning':
+            # Pruning follows exclusion on the same tent, at the same depth
+            self.level = self.levels.pop(item, 0)
+        start = time.perf_counter()
+        result = check(item)
+        stats.seconds[rule] += time.perf_counter() - start
+        stats.examined[rule] += 1
+        stats.steps += 1
+        return result
+
+    def deepen(self, index, row, col, cell):
+        """Record the depth of a square just decided on what it queued."""
+        level = self.level + 1
+        self.stats.depth = max(self.stats.depth, level)
+        keys = [('row', row), ('col', col)]
+        cells = self.guess.cells
+        keys.extend(index + offset for offset in self.guess.adjacent if cells[index + offset] == CELL_TREE)
+        if cell == CELL_TENT:
+            keys.append(index)
+        levels = self.levels
+        for key in keys:
+            if levels.get(key, 0) < level:
+                levels[key] = level
+
+    def check_matching(self, item):
+        """Apply the TentMatching rule.
+
+        Returns:
+            True if it filled in any squares. If the trees cannot all
+            be paired it sets conflict instead.
+        """
+        if not self.matching.update():
+            self.conflict = True
+            return False
+        unused = self.matching.prune()
+        for index in unused:
+            self.assign(index, CELL_EMPTY_GUESS)
+        return bool(unused)
+
+    def check_row(self, row):
+        guess = self.guess
+        empty = guess.row_counts[CELL_EMPTY][row]
+        have = guess.row_counts[CELL_TENT][row]
+        if have > self.row_tents[row] or have + empty < self.row_tents[row]:
+            self.conflict = True
+        elif empty and (self.row_tents[row] == have + empty or self.fill_lines and self.row_tents[row] == have):
+            cell = CELL_TENT if self.row_tents[row] == have + empty else CELL_EMPTY_GUESS
+            cells = guess.cells
+            start = guess.row_start[row]
+            for index in range(start, start + guess.cols):
+                if cells[index] == CELL_EMPTY:
+                    self.assign(index, cell)
+
+    def check_col(self, col):
+        guess = self.guess
+        empty = guess.col_counts[CELL_EMPTY][col]
+        have = guess.col_counts[CELL_TENT][col]
+        if have > self.col_tents[col] or have + empty < self.col_tents[col]:
+            self.conflict = True
+        elif empty and (self.col_tents[col] == have + empty or self.fill_lines and self.col_tents[col] == have):
+            cell = CELL_TENT if self.col_tents[col] == have + empty else CELL_EMPTY_GUESS
+            cells = guess.cells
+            stride = guess.stride
+            start = guess.row_start[0] + col
+            for index in range(start, start + guess.rows * stride, stride):
+                if cells[index] == CELL_EMPTY:
+                    self.assign(index, cell)
+
+    def check_tree(self, index):
+        # A tree that has no tents around it and only one empty adjacent square
+        cells = self.guess.cells
+        empty = []
+        for offset in self.guess.adjacent:
+            if cells[index + offset] == CELL_EMPTY:
+                empty.append(index + offset)
+            elif cells[index + offset] == CELL_TENT:
+                return
+        if len(empty) == 1:
+            self.assign(empty[0], CELL_TENT)
+        elif not empty:
+            self.conflict = True
+
+    def check_exclusion(self, index):
+        # A square that has a tent cannot have tents around it
+        cells = self.guess.cells
+        for offset in self.guess.around:
+            if cells[index + offset] == CELL_EMPTY:
+                self.assign(index + offset, CELL_EMPTY_GUESS)
+            elif offset and cells[index + offset] == CELL_TENT:
+                self.conflict = True
+                return
+
+    def check_pruning(self, index):
+        # If a tent has only one tree near it, the empty squares
+        # around that tree that touch no other tree cannot have tents
+        cells = self.guess.cells
+        adjacent = self.guess.adjacent
+        trees = [index + offset for offset in adjacent if cells[index + offset] == CELL_TREE]
+        if len(trees) == 1:
+            for offset in adjacent:
+                empty = trees[0] + offset
+                if cells[empty] == CELL_EMPTY:
+                    count = 0
+                    for around_empty in adjacent:
+                        if cells[empty + around_empty] == CELL_TREE:
+                            count += 1
+                    if count == 1:
+                        self.assign(empty, CELL_EMPTY_GUESS)
+
+
+def solver(board, guess, matching=False, stats=None, trace=None):
+    """Fill in as much of guess as can be deduced from the clues.
+
+    Args:
+        board    - The board, with its tents
+        guess    - The player's guesses, changed in place
+        matching - If True, also use the rule that every tree needs
+                   its own tent (see TentMatching). It deduces more
+                   than the local rules alone.
+        stats    - Optional, a SolverStats to count each rule's work in
+        trace    - Optional, called as trace(rule, row, col, cell) for
+                   every square filled in, in the order they are
+
+    Returns:
+        none
+    """
+    if not isinstance(guess, Board):
+        work = Board.from_lists(guess)
+        solver(board, work, matching=matching, stats=stats, trace=trace)
+        store_board(guess, work)
+        return
+
+    row_tents, col_tents = clues(board)
+    propagator = Propagator(guess, row_tents, col_tents, matching=TentMatching(guess) if matching else None,
+                            stats=stats, trace=trace)
+    propagator.queue_all()
+    propagator.run()
+
+
+def augment(start, choices, mate, back, spare=None):
+    """Grow a matching by one along an augmenting path.
+
+    Look for a path from start to a target nobody has claimed,
+    taking each claimed target along the way from its old owner.
+    Every target on the path that had an owner still has one
+    afterwards, so augmenting never unmatches a target.
+
+    If spare is given, a target whose owner is spare can also end
+    the path: the owner is simply unmatched.
+
+    Args:
+        start   - The vertex to find a target for
+        choices - A function giving the targets a vertex may take
+        mate    - A dict from each claimed target to its owner
+        back    - A dict from each owner to its target
+        spare   - Optional, a function that is True for owners
+                  that may be left without a target
+
+    Returns:
+        True  - start now has a target, mate and back are updated
+        False - There is no augmenting path from start
+    """
+    visited = {}
+    path = [start]
+    options = [iter(choices(start))]
+    via = []
+    while path:
+        for target in options[-1]:
+            if target not in visited:
+                break
+        else:
+            path.pop()
+            options.pop()
+            if via:
+                via.pop()
+            continue
+        visited[target] = True
+        via.append(target)
+        owner = mate.get(target)
+        if owner is not None and spare is not None and spare(owner):
+            del back[owner]
+            owner = None
+        if owner is None:
+            for vertex, target in zip(path, via):
+                mate[target] = vertex
+                back[vertex] = target
+            return True
+        path.append(owner)
+        options.append(iter(choices(owner)))
+    return False
+
+
+def hopcroft_karp(sources, choices, mate, back):
+    """Give every source a target, a whole phase of augmenting paths at a time.
+
+    Each phase finds the layers of alternating paths from the
+    unmatched sources with a breadth first search, then augments
+    along as many of them as it can with depth first searches that
+    only step one layer deeper each time. An existing matching in
+    mate and back is kept and grown, so a nearly complete matching
+    only needs a few short paths to finish.
+
+    Args:
+        sources - The vertices that each need a target
+        choices - A function giving the targets a vertex may take
+        mate    - A dict from each claimed target to its owner
+        back    - A dict from each owner to its target
+
+    Returns:
+        True  - Every source has a target
+        False - Some source can never have a target
+    """
+    while True:
+        free = [source for source in sources if source not in back]
+        if not free:
+            return True
+
+        # Breadth first: the layer of each vertex that can be reached
+        layer = dict.fromkeys(free, 0)
+        queue = deque(free)
+        found = False
+        while queue:
+            vertex = queue.popleft()
+            for target in choices(vertex):
+                owner = mate.get(target)
+                if owner is None:
+                    found = True
+                elif owner not in layer:
+                    layer[owner] = layer[vertex] + 1
+                    queue.append(owner)
+        if not found:
+            return False
+
+        # Depth first: augment along paths that follow the layers
+        augmented = False
+        for source in free:
+            path = [source]
+            options = [iter(choices(source))]
+            via = []
+            while path:
+                vertex = path[-1]
+                for target in options[-1]:
+                    owner = mate.get(target)
+                    if owner is None or layer.get(owner) == layer[vertex] + 1:
+                        break
+                else:
+                    # Nothing deeper works from here, never try it again
+                    layer[vertex] = None
+                    path.pop()
+                    options.pop()
+                    if via:
+                        via.pop()
+                    continue
+                via.append(target)
+                if owner is None:
+                    for vertex, target in zip(path, via):
+                        mate[target] = vertex
+                        back[vertex] = target
+                    augmented = True
+                    break
+                path.append(owner)
+                options.append(iter(choices(owner)))
+        if not augmented:
+            return False
+
+
+class TentMatching:
+    """Keep every tree paired with its own tent, or a square that could be one.
+
+    Each tree needs its own tent next to it (up, down, left or right)
+    and each tent needs its own tree, so the trees and the squares
+    that are tents in the solution are a perfect matching. A tree can
+    only be paired with a tent or an empty square next to it, and
+    every tent has to be paired.
+
+    The pairing is kept between calls to update(), which only repairs
+    the pairs that the squares decided since then broke. prune() then
+    finds the empty squares that no such pairing can use: they cannot
+    be tents.
+
+    Attributes:
+        guess - The Board being solved
+        trees - The index of every tree on the board
+        mate  - A dict from each paired square to its tree
+        back  - A dict from each paired tree to its square
+    """
+    __slots__ = ('guess', 'trees', 'mate', 'back')
+
+    def __init__(self, guess):
+        cells = guess.cells
+        self.guess = guess
+        self.trees = [index for start in guess.row_start for index in range(start, start + guess.cols)
+                      if cells[index] == CELL_TREE]
+        self.mate = {}
+        self.back = {}
+
+    def copy(self, guess):
+        """Make a copy of the pairing to go with a copy of the guess board."""
+        matching = TentMatching.__new__(TentMatching)
+        matching.guess = guess
+        matching.trees = self.trees
+        matching.mate = dict(self.mate)
+        matching.back = dict(self.back)
+        return matching
+
+    def trees_next_to(self, square):
+        cells = self.guess.cells
+        return [square + offset for offset in self.guess.adjacent if cells[square + offset] == CELL_TREE]
+
+    def squares_next_to(self, tree):
+        cells = self.guess.cells
+        return [tree + offset for offset in self.guess.adjacent
+                if cells[tree + offset] == CELL_TENT or cells[tree + offset] == CELL_EMPTY]
+
+    def update(self):
+        """Repair the pairing after squares have been decided.
+
+        Returns:
+            True  - Every tree and every tent is paired
+            False - That cannot be done, the guess is impossible
+        """
+        guess = self.guess
+        cells = guess.cells
+        mate = self.mate
+        back = self.back
+
+        # Squares that can no longer be tents lose their tree
+        for square in [square for square in mate if cells[square] != CELL_TENT and cells[square] != CELL_EMPTY]:
+            del back[mate.pop(square)]
+
+        # Pair the tents first, taking trees away from empty squares
+        # if need be. Pairing the trees afterwards never takes a tent
+        # away from the tree it was paired with.
+        if sum(guess.row_counts[CELL_TENT]) > len(self.trees):
+            return False
+        for start in guess.row_start:
+            index = cells.find(CELL_TENT, start, start + guess.cols)
+            while index >= 0:
+                if index not in mate and not augment(index, self.trees_next_to, back, mate,
+                                                     spare=lambda square: cells[square] == CELL_EMPTY):
+                    return False
+                index = cells.find(CELL_TENT, index + 1, start + guess.cols)
+
+        return hopcroft_karp(self.trees, self.squares_next_to, mate, back)
+
+    def prune(self):
+        """Find the empty squares that no pairing of trees and tents can use.
+
+        Call after update() has returned True. A tree can let go of
+        its square if that square is empty, or if it can take the
+        square of another tree that can let go of its own. An empty
+        square that is not paired can only be used by a tree next to
+        it that can let go.
+
+        Returns:
+            A list of the indexes of empty squares that cannot be tents
+        """
+        cells = self.guess.cells
+        adjacent = self.guess.adjacent
+        mate = self.mate
+        back = self.back
+
+        free = [tree for tree in self.trees if cells[back[tree]] == CELL_EMPTY]
+        can_move = dict.fromkeys(free, True)
+        while free:
+            tree = free.pop()
+            for offset in adjacent:
+                other = mate.get(tree + offset)
+                if other is not None and other not in can_move:
+                    can_move[other] = True
+                    free.append(other)
+
+        unused = []
+        for tree in self.trees:
+            for offset in adjacent:
+                square = tree + offset
+                if cells[square] == CELL_EMPTY and square not in mate:
+                    for around_square in adjacent:
+                        if square + around_square in can_move:
+                            break
+                    else:
+                        unused.append(square)
+        return unused
+
+
+def match_trees(guess):
+    """Pair every tree with its own tent, or with a square that could be one.
+
+    On a finished board that is exactly the rule the trees and tents
+    have to follow; on a partly finished board, if it cannot be done,
+    no way of finishing the board will work either.
+
+    Args:
+        guess - A Board
+
+    Returns:
+        A dict from the index of each paired square to the index of
+        its tree, or None if the trees cannot all be paired.
+    """
+    matching = TentMatching(guess)
+    if not matching.update():
+        return None
+    return matching.mate
+
+
+def search(guess, row_tents, col_tents, limit=2, stats=None):
+    """Find complete solutions of a guess board by propagation and branching.
+
+    Run the Propagator rules, including the TentMatching rule, to a
+    fixed point, then pick an undecided square next to the tree with
+    the fewest choices left and try it both as a tent and as empty.
+    A branch is abandoned as soon as the Propagator finds a conflict.
+
+    Args:
+        guess     - A Board with the trees and any squares already
+                    decided; it is not changed
+        row_tents - The number of tents in each row
+        col_tents - The number of tents in each col
+        limit     - Stop after finding this many solutions
+        stats     - Optional, a SolverStats to count the work in
+
+    Returns:
+        A list of at most limit solved Boards
+    """
+    solutions = []
+    work = JournalBoard.from_board(guess)
+    # The matching only ever pairs trees with tents and empty squares,
+    # and rolling back only turns squares back into empty ones, so the
+    # pairs stay usable on every branch and update() repairs the rest.
+    matching = TentMatching(work)
+    propagator = Propagator(work, row_tents, col_tents, fill_lines=True, stats=stats)
+
+    # Each entry is the snapshot to go back to and the decision to
+    # make there. The root has no decision and starts from a full queue.
+    stack = [[work.snapshot(), None, None]]
+    while stack:
+        snapshot, index, cell = stack.pop()
+        work.rollback(snapshot)
+        propagator.reset(work, matching)
+        if index is None:
+            propagator.queue_all()
+        else:
+            # A guess is not a deduction, so it is not counted or traced
+            # as one. What it leads to starts again at depth 0.
+            work.put(index, cell)
+            propagator.touch(index)
+        if not propagator.run():
+            continue
+
+        index = choose_branch(work)
+        if index is None:
+            solutions.append(work.copy())
+            if len(solutions) >= limit:
+                break
+            continue
+
+        if stats is not None:
+            stats.branches += 1
+        snapshot = work.snapshot()
+        stack.append([snapshot, index, CELL_EMPTY_GUESS])
+        stack.append([snapshot, index, CELL_TENT])
+
+    return solutions
+
+
+def choose_branch(guess):
+    """Pick the undecided square to branch on next.
+
+    Prefer a square next to a tree that still needs a tent and has
+    the fewest empty squares next to it.
+
+    Args:
+        guess - A Board
+
+    Returns:
+        The index of an empty square in guess.cells, or None if
+        every square has been decided.
+    """
+    if not any(guess.row_counts[CELL_EMPTY]):
+        return None
+
+    cells = guess.cells
+    adjacent = guess.adjacent
+    best = None
+    fewest = 5
+    for start in guess.row_start:
+        for index in range(start, start + guess.cols):
+            if cells[index] == CELL_TREE:
+                empty = []
+                for offset in adjacent:
+                    if cells[index + offset] == CELL_EMPTY:
+                        empty.append(index + offset)
+                    elif cells[index + offset] == CELL_TENT:
+                        break
+                else:
+                    if empty and len(empty) < fewest:
+                        best = empty[0]
+                        fewest = len(empty)
+                        if fewest <= 2:
+                            return best
+    if best is not None:
+        return best
+
+    for row, start in enumerate(guess.row_start):
+        if guess.row_counts[CELL_EMPTY][row]:
+            return cells.index(CELL_EMPTY, start, start + guess.cols)
+
+
+def split_regions(guess, row_tents, col_tents):
+    """Split the undecided squares of a guess into puzzles that can be solved on their own.
+
+    Two empty squares are in the same region if one is around the
+    other, if they are next to the same tree, or if they are in the
+    same row or col. A tree is in the region of the empty squares and
+    tents next to it, and a tent is in the region of the trees next
+    to it, so every pairing of trees and tents that could change is
+    inside one region. What one region does then cannot affect any
+    other, and the solutions of the whole board are every way of
+    putting together one solution of each region.
+
+    Each region is cut out of the guess as a Board just big enough to
+    hold it, with the squares of other regions left out and the tents
+    each of its rows and cols still needs as its clues.
+
+    Args:
+        guess     - A Board, best run through the Propagator first
+                    so the regions are as small as they can be
+        row_tents - The number of tents in each row
+        col_tents - The number of tents in each col
+
+    Returns:
+        A list of (top, left, board, row_tents, col_tents), one per
+        region: where its board goes on the guess, the board, and
+        its clues
+    """
+    cells = guess.cells
+    stride = guess.stride
+    first = guess.row_start[0]
+    around = [offset for offset in guess.around if offset]
+    adjacent = guess.adjacent
+    # The rows and cols go in with the squares, numbered below 0
+    col_node = -1 - guess.rows
+    parent = {}
+
+    def find(node):
+        root = node
+        while parent[root] != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    def union(a, b):
+        a = find(a)
+        b = find(b)
+        if a != b:
+            parent[a] = b
+
+    trees = []
+    for row, start in enumerate(guess.row_start):
+        index = cells.find(CELL_EMPTY, start, start + guess.cols)
+        while index >= 0:
+            parent.setdefault(index, index)
+            parent.setdefault(-1 - row, -1 - row)
+            union(index, -1 - row)
+            col = index - start
+            parent.setdefault(col_node - col, col_node - col)
+            union(index, col_node - col)
+            for offset in around:
+                if cells[index + offset] == CELL_EMPTY and index + offset in parent:
+                    union(index, index + offset)
+            for offset in adjacent:
+                if cells[index + offset] == CELL_TREE:
+                    if index + offset not in parent:
+                        parent[index + offset] = index + offset
+                        trees.append(index + offset)
+                    union(index, index + offset)
+            index = cells.find(CELL_EMPTY, index + 1, start + guess.cols)
+
+    # Follow the trees to their tents, and those tents to their trees
+    while trees:
+        tree = trees.pop()
+        for offset in adjacent:
+            tent = tree + offset
+            if cells[tent] == CELL_TENT:
+                if tent not in parent:
+                    parent[tent] = tent
+                    for other in adjacent:
+                        if cells[tent + other] == CELL_TREE and tent + other not in parent:
+                            parent[tent + other] = tent + other
+                            trees.append(tent + other)
+                union(tree, tent)
+
+    members = {}
+    for node in parent:
+        if node >= 0:
+            members.setdefault(find(node), []).append(node)
+
+    regions = []
+    for root, squares in members.items():
+        places = [divmod(index - first, stride) for index in squares]
+        top = min(row for row, col in places)
+        left = min(col for row, col in places)
+        board = Board(max(row for row, col in places) - top + 1, max(col for row, col in places) - left + 1,
+                      fill=CELL_EMPTY_GUESS)
+        for index, (row, col) in zip(squares, places):
+            board.put(board.index(row - top, col - left), cells[index])
+
+        # A row or col with empty squares has them all in one region,
+        # so the tents it still needs are all that region's to place.
+        # Other regions crossing it only keep the tents they have.
+        region_rows = [board.row_counts[CELL_TENT][row] for row in range(board.rows)]
+        for row in range(board.rows):
+            if guess.row_counts[CELL_EMPTY][top + row] and find(-1 - (top + row)) == root:
+                region_rows[row] += row_tents[top + row] - guess.row_counts[CELL_TENT][top + row]
+        region_cols = [board.col_counts[CELL_TENT][col] for col in range(board.cols)]
+        for col in range(board.cols):
+            if guess.col_counts[CELL_EMPTY][left + col] and find(col_node - (left + col)) == root:
+                region_cols[col] += col_tents[left + col] - guess.col_counts[CELL_TENT][left + col]
+        regions.append((top, left, board, region_rows, region_cols))
+    return regions
+
+
+def search_region(board, row_tents, col_tents, limit=2, count=False):
+    """search() one region from split_regions(), where a process pool can run it.
+
+    Returns:
+        (solutions, stats) - stats is a new SolverStats if count, else None
+    """
+    stats = SolverStats() if count else None
+    return search(board, row_tents, col_tents, limit=limit, stats=stats), stats
+
+
+def search_regions(guess, row_tents, col_tents, limit=2, stats=None, executor=None):
+    """Find complete solutions of a guess board, a region at a time.
+
+    Run the Propagator rules to a fixed point on the whole board,
+    then split what is left with split_regions() and search() each
+    region on its own. Searching the whole board at once, a guess in
+    one region that fails is tried again for every guess made in the
+    other regions, and every guess costs a look at the whole board.
+    Searching the regions apart costs only their own size.
+
+    The rows and cols tie together every empty square along them,
+    so the regions are small when the rules leave a few pockets of
+    squares in different rows and cols. That is what is left of a
+    large puzzle that nearly solves itself. A board that the rules
+    barely touch is one big region and is searched as before.
+
+    Args:
+        guess     - A Board with the trees and any squares already
+                    decided; it is not changed
+        row_tents - The number of tents in each row
+        col_tents - The number of tents in each col
+        limit     - Stop after finding this many solutions
+        stats     - Optional, a SolverStats to count the work in
+        executor  - Optional, a concurrent.futures executor to search
+                    the regions in, such as a ProcessPoolExecutor
+
+    Returns:
+        A list of at most limit solved Boards
+    """
+    work = guess.copy()
+    propagator = Propagator(work, row_tents, col_tents, fill_lines=True, matching=TentMatching(work), stats=stats)
+    propagator.queue_all()
+    if not propagator.run():
+        return []
+
+    regions = split_regions(work, row_tents, col_tents)
+    jobs = [[board for top, left, board, rows, cols in regions],
+            [rows for top, left, board, rows, cols in regions],
+            [cols for top, left, board, rows, cols in regions],
+            [limit] * len(regions), [stats is not None] * len(regions)]
+    results = map(search_region, *jobs) if executor is None else executor.map(search_region, *jobs)
+
+    found = []
+    for solutions, region_stats in results:
+        if stats is not None:
+            stats.add(region_stats)
+        if not solutions:
+            return []
+        found.append(solutions)
+
+    merged = []
+    for choice in itertools.islice(itertools.product(*found), limit):
+        solution = work.copy()
+        for (top, left, board, rows, cols), region in zip(regions, choice):
+            for row, start in enumerate(board.row_start):
+                at = work.row_start[top + row] + left - start
+                index = board.cells.find(CELL_EMPTY, start, start + board.cols)
+                while index >= 0:
+                    solution.put(at + index, region.cells[index])
+                    index = board.cells.find(CELL_EMPTY, index + 1, start + board.cols)
+        merged.append(solution)
+    return merged
+
+
+def find_solutions(board, limit=2, stats=None, executor=None):
+    """Find the solutions to the puzzle a board makes.
+
+    The puzzle is the trees on the board and the tent counts along
+    its sides. The board's own tents are always one solution, but
+    there may be others.
+
+    Args:
+        board    - The board, with its tents
+        limit    - Stop after finding this many solutions
+        stats    - Optional, a SolverStats to count the work in
+        executor - Optional, an executor to search regions in, see
+                   search_regions()
+
+    Returns:
+        A list of at most limit solved guess Boards
+    """
+    row_tents, col_tents = clues(board)
+    guess = create_guess_board(board)
+    fill_empty(board, guess)
+    return search_regions(guess, row_tents, col_tents, limit=limit, stats=stats, executor=executor)
+
+
+def count_solutions(board, limit=2, stats=None, executor=None):
+    """Count the solutions to the puzzle a board makes, up to limit.
+
+    Args:
+        board    - The board, with its tents
+        limit    - Stop counting after this many solutions
+        stats    - Optional, a SolverStats to count the work in
+        executor - Optional, an executor to search regions in, see
+                   search_regions()
+
+    Returns:
+        0, 1, ... limit - The number of solutions found. A puzzle is
+        uniquely solvable when this is 1 with a limit of 2 or more.
+    """
+    return len(find_solutions(board, limit=limit, stats=stats, executor=executor))
+
+
+def find_swap(board):
+    """Look for two tents that can trade places with the empty squares
+    at the other corners of their rectangle.
+
+    Moving the tents at r1,c1 and r2,c2 to r1,c2 and r2,c1 leaves
+    every row and col with the same number of tents. If the tents
+    still touch no other tent and their trees are still next to
+    them, that is a second solution, found without any searching.
+    Only tents at most 2 rows and cols apart are tried.
+
+    Args:
+        board - The board, with its tents
+
+    Returns:
+        The indexes of the two tents in board.cells, or None
+    """
+    board = as_board(board)
+    mate = match_trees(board)
+    if mate is None:
+        return None
+
+    cells = board.cells
+    stride = board.stride
+    adjacent = board.adjacent
+    tents = [index for start in board.row_start for index in range(start, start + board.cols)
+             if cells[index] == CELL_TENT]
+    for first in tents:
+        for second in tents:
+            if second <= first or second - first > 2 * stride + 2:
+                continue
+            row1, col1 = divmod(first, stride)
+            row2, col2 = divmod(second, stride)
+            if row1 == row2 or col1 == col2 or abs(col1 - col2) > 2 or row2 - row1 == 1 and abs(col1 - col2) == 1:
+                continue
+            square1 = row1 * stride + col2
+            square2 = row2 * stride + col1
+            if cells[square1] != CELL_EMPTY or cells[square2] != CELL_EMPTY:
+                continue
+            touching = False
+            for square in [square1, square2]:
+                for offset in board.around:
+                    other = square + offset
+                    if cells[other] == CELL_TENT and other != first and other != second:
+                        touching = True
+            if touching:
+                continue
+            tree1 = mate[first]
+            tree2 = mate[second]
+            if square1 - tree1 in adjacent and square2 - tree2 in adjacent or \
+                    square1 - tree2 in adjacent and square2 - tree1 in adjacent:
+                return first, second
+    return None
+
+
+def quick_reject(board, min_trees=0):
+    """Cheap checks that rule a board out as a puzzle before searching it.
+
+    Only checks that never throw away a board with one solution are
+    on by default, so generate_puzzle() still makes the same puzzle
+    from each seed and puzzle ids keep working. That leaves out:
+
+        - Too few trees for the area, which is legal, so it is only
+          checked when asked to with min_trees
+        - Rows or cols with no tents, which are legal too
+        - Regions cut off from the rest of the board, which do not
+          make a second solution on their own. find_solutions()
+          searches them apart instead, see split_regions().
+
+    Args:
+        board     - The board, with its tents
+        min_trees - Reject boards with fewer trees than this, they
+                    make puzzles too easy to be worth playing
+
+    Returns:
+        A string saying why the board was rejected, or None if it
+        passed. A board is only rejected for having two solutions if
+        it certainly does.
+    """
+    board = as_board(board)
+    trees = sum(board.row_counts[CELL_TREE])
+    if trees < min_trees:
+        return "only %d trees on %d squares" % (trees, board.rows * board.cols)
+    if find_swap(board) is not None:
+        return "two tents can swap places"
+    return None
+
+
+def solve_by_deduction(board, stats=None):
+    """Solve the puzzle a board makes using the deduction rules alone.
+
+    Run the Propagator, with the TentMatching rule, once. Rather than
+    guess when the rules run out, give up: the puzzle might still have
+    only one solution, but the player would have to guess to find it.
+
+    Args:
+        board - The board, with its tents
+        stats - Optional, a SolverStats to count the work in
+
+    Returns:
+        The solved guess Board, or None if the rules could not finish it
+    """
+    row_tents, col_tents = clues(board)
+    guess = create_guess_board(board)
+    fill_empty(board, guess)
+    propagator = Propagator(guess, row_tents, col_tents, fill_lines=True, matching=TentMatching(guess),
+                            stats=stats)
+    propagator.queue_all()
+    if not propagator.run() or any(guess.row_counts[CELL_EMPTY]):
+        return None
+    return guess
+
+
+def solver_sweep(board, guess):
+    """Fill in as much of guess as can be deduced, by sweeping the whole board.
+
+    This is how solver() used to work: apply every rule to every
+    row, col and square, over and over, until a whole pass changes
+    nothing. It is kept as the reference that solver() is checked
+    against.
+
+    Args:
+        board - The board, with its tents
+        guess - The player's guesses, changed in place
+
+    Returns:
+        none
+    """
+    if not isinstance(guess, Board):
+        work = Board.from_lists(guess)
+        solver_sweep(board, work)
+        store_board(guess, work)
+        return
+
+    row_tents, col_tents = clues(board)
+    cells = guess.cells
+    stride = guess.stride
+    adjacent = guess.adjacent
+    around = guess.around
     modified = True
 
     while modified:
         modified = False
 
-        for row in range(len(guess)):
-            tents = count_tents(board, row=row)
+        for row in range(guess.rows):
+            tents = row_tents[row]
             empty = count_tents(guess, row=row, match=BOARD_EMPTY)
             have = count_tents(guess, row=row)
             if tents == have + empty:
-                for col in range(len(guess[row])):
-                    if guess[row][col] == BOARD_EMPTY:
-                        set(guess, row, col, BOARD_TENT)
+                start = guess.row_start[row]
+                for index in range(start, start + guess.cols):
+                    if cells[index] == CELL_EMPTY:
+                        guess.put(index, CELL_TENT)
                         modified = True
 
-        for col in range(len(guess[0])):
-            tents = count_tents(board, col=col)
+        for col in range(guess.cols):
+            tents = col_tents[col]
             empty = count_tents(guess, col=col, match=BOARD_EMPTY)
             have = count_tents(guess, col=col)
             if tents == have + empty:
-                for row in range(len(guess)):
-                    if guess[row][col] == BOARD_EMPTY:
-                        set(guess, row, col, BOARD_TENT)
+                start = guess.row_start[0] + col
+                for index in range(start, start + guess.rows * stride, stride):
+                    if cells[index] == CELL_EMPTY:
+                        guess.put(index, CELL_TENT)
                         modified = True
 
         # A tree that has no tents around it and only one empty adjacent square
-        for row in range(len(guess)):
-            for col in range(len(guess[row])):
-                if get(guess, row, col) == BOARD_TREE:
+        for start in guess.row_start:
+            for index in range(start, start + guess.cols):
+                if cells[index] == CELL_TREE:
                     empty = []
                     tent = False
-                    for adjacent in [[-1, 0], [0, -1], [0, 1], [1, 0]]:
-                        if get(guess, row+adjacent[0], col+adjacent[1]) == BOARD_EMPTY:
-                            empty.append(adjacent)
-                        if get(guess, row + adjacent[0], col + adjacent[1]) == BOARD_TENT:
+                    for offset in adjacent:
+                        if cells[index + offset] == CELL_EMPTY:
+                            empty.append(index + offset)
+                        elif cells[index + offset] == CELL_TENT:
                             tent = True
                     if len(empty) == 1 and not tent:
-                        adjacent = empty[0]
-                        if get(guess, row + adjacent[0], col + adjacent[1]) == BOARD_EMPTY:
-                            set(guess, row + adjacent[0], col + adjacent[1], BOARD_TENT)
-                            modified = True
+                        guess.put(empty[0], CELL_TENT)
+                        modified = True
 
         # A square that has a tent cannot have tents around it
-        for row in range(len(guess)):
-            for col in range(len(guess[row])):
-                if get(guess, row, col) == BOARD_TENT:
-                    for r in [-1, 0, 1]:
-                        for c in [-1, 0, 1]:
-                            if get(guess, row+r, col+c) == BOARD_EMPTY:
-                                set(guess, row+r, col+c, BOARD_EMPTY_GUESS)
-                                modified = True
+        for start in guess.row_start:
+            for index in range(start, start + guess.cols):
+                if cells[index] == CELL_TENT:
+                    for offset in around:
+                        if cells[index + offset] == CELL_EMPTY:
+                            guess.put(index + offset, CELL_EMPTY_GUESS)
+                            modified = True
 
         # If a tent has only one tree near it, then it must
         # satisfy that tree. If that tree has open spaces
         # around it that do not touch other trees, then we
         # know those open spaces cannot have tents.
-        for row in range(len(guess)):
-            for col in range(len(guess[row])):
-                if get(guess, row, col) == BOARD_TENT:
-                    trees = []
-                    for adjacent in [[-1, 0], [0, -1], [0, 1], [1, 0]]:
-                        if get(guess, row+adjacent[0], col+adjacent[1]) == BOARD_TREE:
-                            trees.append([row+adjacent[0], col+adjacent[1]])
+        for start in guess.row_start:
+            for index in range(start, start + guess.cols):
+                if cells[index] == CELL_TENT:
+                    trees = [index + offset for offset in adjacent if cells[index + offset] == CELL_TREE]
                     # If a tent has only one tree near it then it must satisfy that tree.
                     if len(trees) == 1:
-                        r = trees[0][0]
-                        c = trees[0][1]
-                        for adjacent in [[-1, 0], [0, -1], [0, 1], [1, 0]]:
-                            if get(guess, r + adjacent[0], c + adjacent[1]) == BOARD_EMPTY:
-                                # If that tree has open spaces around it ...
+                        tree = trees[0]
+                        for offset in adjacent:
+                            # If that tree has open spaces around it ...
+                            empty = tree + offset
+                            if cells[empty] == CELL_EMPTY:
                                 count = 0
-                                empty_r = r + adjacent[0]
-                                empty_c = c + adjacent[1]
-                                for adjacent in [[-1, 0], [0, -1], [0, 1], [1, 0]]:
-                                    if get(guess, empty_r + adjacent[0], empty_c + adjacent[1]) == BOARD_TREE:
+                                for around_empty in adjacent:
+                                    if cells[empty + around_empty] == CELL_TREE:
                                         count += 1
                                 # ... that do not touch other trees
                                 if count == 1:
-                                    set(guess, empty_r, empty_c, BOARD_EMPTY_GUESS)
+                                    guess.put(empty, CELL_EMPTY_GUESS)
                                     modified = True
 
 
-def play():
-    """Play the game. Let the user try to solve it.
+def generate_puzzle(rows, cols, density=40, verbose=False, rng=None, deduce=False, min_trees=0, stats=None):
+    """Create boards until one makes a puzzle with exactly one solution.
+
+    Each board first goes through quick_reject(), so most boards with
+    two solutions are thrown away without searching them.
+
+    Args:
+        rows      - The number of rows to put in the board
+        cols      - The number of cols to put in the board
+        density   - The density of trees as a percentage (0-100)
+        verbose   - If True, print a line for every board tried
+        rng       - Optional, a seed or random number generator. The
+                    same seed always generates the same puzzle.
+        deduce    - If True, only accept puzzles solve_by_deduction()
+                    can finish. Each board is then checked without any
+                    guessing, which is much faster on large boards.
+        min_trees - Reject boards with fewer trees than this
+        stats     - Optional, a SolverStats to count the work of
+                    checking the accepted board in, for grade_puzzle()
 
     Returns:
-        none
+        A new Board whose trees and tent counts have only one solution.
+        With the default deduce and min_trees, puzzle_from_id() makes
+        the same puzzle again from the same seed.
     """
+    rng = as_rng(rng)
     count = 0
     while True:
         count += 1
-        board = create_board(6, 6, density=40)
-        guess = create_guess_board(board)
-        fill_empty(board, guess)
-        print('Attempting to solve (%d) ...' % count)
-        solver(board, guess)
-        if solved(board, guess):
-            guess = create_guess_board(board)
-            fill_empty(board, guess)
-            break
+        board = create_board(rows, cols, density=density, rng=rng)
+        reason = quick_reject(board, min_trees=min_trees)
+        if reason is not None:
+            if verbose:
+                print('Rejected (%d): %s' % (count, reason))
+            continue
+        if verbose:
+            print('Attempting to solve (%d) ...' % count)
+        attempt = SolverStats() if stats is not None else None
+        if deduce:
+            accepted = solve_by_deduction(board, stats=attempt) is not None
+        else:
+            accepted = count_solutions(board, limit=2, stats=attempt) == 1
+        if accepted:
+            if stats is not None:
+                stats.add(attempt)
+            return board
+
+
+def build_puzzle(rows, cols, density=40, rng=None, stats=None):
+    """Build a puzzle one tree and tent at a time, keeping it solvable.
+
+    Like create_board(), go through the squares and roll for a tree
+    on each one. A tree is only kept, with one of the squares next
+    to it as its tent, if the deduction rules can still solve the
+    whole board. If no square for its tent works the tree is left
+    out. The board is solvable after every step, so unlike
+    generate_puzzle() there is no retrying whole boards, and the time
+    taken depends only on the size of the board.
+
+    The puzzle as the player first sees it is kept on one
+    JournalBoard, with one Propagator and TentMatching, and grown a
+    tree at a time. Each tent tried runs the rules on it, the same as
+    solve_by_deduction() would, and rolls them back, rather than set
+    up a new board and pair up every tree again.
 
-    cursor = [0, 0]
+    Args:
+        rows    - The number of rows to put in the board
+        cols    - The number of cols to put in the board
+        density - The density of trees as a percentage (0-100)
+        rng     - Optional, a seed or random number generator. The
+                  same seed always builds the same puzzle.
+        stats   - Optional, a SolverStats to count the work of solving
+                  the finished board in, for grade_puzzle(). It is
+                  counted while trying the last tree kept, so the
+                  board is not solved again at the end.
 
-    while True:
-        print()
-        print_board(board, guess, cursor=cursor)
-        if solved(board, guess):
-            print('\nYou solved it. Great work!')
-            break
-        # stuff = input('Your turn [1-9, ~, ^, s, ?, h, q]: ')
-        # command = stuff.split()
-        print('Your turn [1-9, ~, ^, s, ?, h, q]: ')
-        stuff = msvcrt.getch()
-        print('stuff = /%s/' % stuff)
-        command = stuff.split()
-        if len(command) == 0:
-            continue
-        if command[0] == 'q':
-            break
-        elif command[0] == 'h':
-            print_board(board, cursor=cursor)
-        elif command[0] == 's':
-            solver(board, guess)
-        elif command[0] == '?':
-            if board[cursor[0]][cursor[1]] == BOARD_TENT:
-                set(guess, cursor[0], cursor[1], BOARD_TENT)
-            if board[cursor[0]][cursor[1]] == BOARD_EMPTY:
-                set(guess, cursor[0], cursor[1], BOARD_EMPTY_GUESS)
-        elif command[0] in ['~', '^']:
-            if get(guess, cursor[0], cursor[1]) == BOARD_TREE:
-                print('Please do not cut down the trees!')
+    Returns:
+        A new Board whose trees and tent counts have only one
+        solution, which the deduction rules find without guessing
+    """
+    rng = as_rng(rng)
+    board = Board(rows, cols)
+    cells = board.cells
+
+    # The squares next to no tree start out ruled out, as fill_empty()
+    # leaves them, and the rows and cols that have all their tents are
+    # filled in by the Propagator's fill_lines
+    puzzle = JournalBoard(rows, cols, fill=CELL_EMPTY_GUESS)
+    row_tents = [0] * rows
+    col_tents = [0] * cols
+    matching = TentMatching(puzzle)
+    propagator = Propagator(puzzle, row_tents, col_tents, fill_lines=True)
+    solved = None
+
+    for row in range(rows):
+        for col in range(cols):
+            tree = board.index(row, col)
+            if cells[tree] != CELL_EMPTY or not percent_chance(density, rng=rng):
+                continue
+            choices = [tree + offset for offset in board.adjacent
+                       if cells[tree + offset] == CELL_EMPTY and
+                       all(cells[tree + offset + around] != CELL_TENT for around in board.around)]
+            rng.shuffle(choices)
+            board.put(tree, CELL_TREE)
+            before = puzzle.snapshot()
+            puzzle.put(tree, CELL_TREE)
+            for offset in puzzle.adjacent:
+                if puzzle.cells[tree + offset] == CELL_EMPTY_GUESS:
+                    puzzle.put(tree + offset, CELL_EMPTY)
+            matching.trees.append(tree)
+            start = puzzle.snapshot()
+
+            for tent in choices:
+                tent_row, tent_col = divmod(tent - board.row_start[0], board.stride)
+                row_tents[tent_row] += 1
+                col_tents[tent_col] += 1
+                attempt = SolverStats() if stats is not None else None
+                propagator.stats = attempt
+                if stats is not None:
+                    # Rule out the rows and cols with no tents first, as
+                    # fill_empty() does, so the work counted is the same
+                    # as solve_by_deduction() would count
+                    for line, tents in enumerate(row_tents):
+                        if not tents:
+                            end = puzzle.row_start[line] + cols
+                            index = puzzle.cells.find(CELL_EMPTY, puzzle.row_start[line], end)
+                            while index >= 0:
+                                puzzle.put(index, CELL_EMPTY_GUESS)
+                                index = puzzle.cells.find(CELL_EMPTY, index + 1, end)
+                    for line, tents in enumerate(col_tents):
+                        if not tents:
+                            top = puzzle.row_start[0] + line
+                            squares = puzzle.cells[top::puzzle.stride][:rows]
+                            down = squares.find(CELL_EMPTY)
+                            while down >= 0:
+                                puzzle.put(top + down * puzzle.stride, CELL_EMPTY_GUESS)
+                                down = squares.find(CELL_EMPTY, down + 1)
+                propagator.reset(puzzle, matching)
+                propagator.queue_all()
+                done = propagator.run() and not any(puzzle.row_counts[CELL_EMPTY])
+                puzzle.rollback(start)
+                if done:
+                    board.put(tent, CELL_TENT)
+                    solved = attempt
+                    break
+                row_tents[tent_row] -= 1
+                col_tents[tent_col] -= 1
             else:
-                set(guess, cursor[0], cursor[1], command[0])
-        elif command[0] in ['1', '2', '3', '4', '6', '7', '8', '9']:
-            dir = int(command[0])
-            adjacent = [
-                [0, 0],    #
-                [1, -1],   # 1
-                [1, 0],    # 2
-                [1, 1],    # 3
-                [0, -1],   # 4
-                [0, 0],    #
-                [0, 1],    # 6
-                [-1, -1],  # 7
-                [-1, 0],   # 8
-                [-1, 1]    # 9
-            ]
-            cursor[0] += adjacent[dir][0]
-            cursor[1] += adjacent[dir][1]
-            if cursor[0] < 0:
-                cursor[0] = len(board) - 1
-            if cursor[0] >= len(board):
-                cursor[0] = 0
-            if cursor[1] < 0:
-                cursor[1] = len(board[0]) - 1
-            if cursor[1] >= len(board[0]):
-                cursor[1] = 0
+                board.put(tree, CELL_EMPTY)
+                puzzle.rollback(before)
+                matching.trees.pop()
+                if tree in matching.back:
+                    del matching.mate[matching.back.pop(tree)]
+
+    if stats is not None and solved is not None:
+        stats.add(solved)
+    return board
+
+
+# How much harder each square decided by a rule makes a puzzle
+RULE_WEIGHTS = {'row': 0, 'col': 0, 'tree': 0, 'exclusion': 0, 'pruning': 1, 'matching': 4}
+# How much harder each guess the solver had to make makes a puzzle
+GUESS_WEIGHT = 20
+
+
+def difficulty(stats):
+    """Score how hard a puzzle is from the SolverStats of solving it.
+
+    The score is the depth of the longest chain of deductions, plus
+    RULE_WEIGHTS for every square decided by one of the harder rules,
+    plus GUESS_WEIGHT for every guess that had to be made. A player
+    can follow a short chain of the easy rules without thinking.
+
+    Args:
+        stats - The SolverStats from solving the puzzle
+
+    Returns:
+        The score, 0 or more. Bigger boards score higher, so only
+        compare scores of boards of the same size.
+    """
+    score = stats.depth + GUESS_WEIGHT * stats.branches
+    for rule in RULES:
+        score += RULE_WEIGHTS[rule] * stats.decided[rule]
+    return score
+
+
+def grade_puzzle(board, stats=None):
+    """Score how hard the puzzle a board makes is, see difficulty().
+
+    Args:
+        board - The board, with its tents
+        stats - Optional, the SolverStats generate_puzzle() or
+                build_puzzle() filled in for this board. Without it
+                the puzzle is solved again to count.
+
+    Returns:
+        The score difficulty() gives it
+    """
+    if stats is None:
+        stats = SolverStats()
+        if solve_by_deduction(board, stats=stats) is None:
+            stats = SolverStats()
+            count_solutions(board, stats=stats)
+    return difficulty(stats)
+
+
+def puzzle_id(rows, cols, density, seed):
+    """Name the puzzle generate_puzzle() makes from a seed.
+
+    The seed fully determines the puzzle, so the id is all that needs
+    to be stored to get the same puzzle back with puzzle_from_id().
+
+    Args:
+        rows    - The number of rows on the board
+        cols    - The number of cols on the board
+        density - The density of trees as a percentage (0-100)
+        seed    - A non-negative int seed
+
+    Returns:
+        A string like '10x12-40-00c0ffee'
+    """
+    return '%dx%d-%d-%08x' % (rows, cols, density, seed)
+
+
+def parse_puzzle_id(name):
+    """Split a puzzle id back into (rows, cols, density, seed).
+
+    Throws:
+        ValueError - name is not a puzzle id
+    """
+    try:
+        size, density, seed = name.split('-')
+        rows, cols = size.split('x')
+        return int(rows), int(cols), int(density), int(seed, 16)
+    except ValueError:
+        raise ValueError("%r is not a puzzle id" % name)
+
+
+def puzzle_from_id(name):
+    """Regenerate the puzzle a puzzle id names.
+
+    Args:
+        name - A puzzle id from puzzle_id()
+
+    Returns:
+        The same Board every time
+    """
+    rows, cols, density, seed = parse_puzzle_id(name)
+    return generate_puzzle(rows, cols, density=density, rng=random.Random(seed))
+
+
+# How each rule is explained to the player when it gives a hint
+RULE_HINTS = {
+    'row': 'this row needs exactly its empty squares for its tents, or has all its tents',
+    'col': 'this col needs exactly its empty squares for its tents, or has all its tents',
+    'tree': 'this is the only square left for the tree next to it',
+    'exclusion': 'tents cannot touch, not even at the corners',
+    'pruning': 'the tree next to it already has its tent, and no other tree can use this square',
+    'matching': 'whichever way the trees and tents pair up, no tree can use this square',
+}
+
+
+class HintEngine:
+    """Find the next square a player can deduce, and the rule that does it.
+
+    The engine keeps its own copy of the player's guess and its own
+    Propagator, with queues of what might still have something to
+    deduce. Between hints it follows the player's changes through the
+    guess's journal and queues only what depends on the squares they
+    changed, so a hint does not solve the board again from scratch.
+    After an undo it compares the whole board instead.
+
+    Attributes:
+        guess      - The player's JournalBoard (or GuessBoard)
+        work       - The engine's copy of the guess
+        propagator - The Propagator working on work
+        seen       - How many of guess.changes the engine has followed
+        last       - The last of guess.changes it followed, to spot an
+                     undo that was followed by new changes
+        found      - The first deduction of the hint being worked out
+        mistake    - True if the last hint found the guess cannot be right
+    """
+    __slots__ = ('guess', 'work', 'propagator', 'seen', 'last', 'found', 'mistake')
+
+    def __init__(self, board, guess):
+        row_tents, col_tents = clues(board)
+        self.guess = guess
+        self.work = JournalBoard.from_board(guess)
+        self.propagator = Propagator(self.work, row_tents, col_tents, fill_lines=True,
+                                     matching=TentMatching(self.work), trace=self.note)
+        self.propagator.queue_all()
+        self.seen = len(guess.changes)
+        self.last = guess.changes[-1] if guess.changes else None
+        self.found = None
+        self.mistake = False
+
+    def note(self, rule, row, col, cell):
+        if self.found is None:
+            self.found = (rule, row, col, cell)
+
+    def follow(self):
+        """Bring work up to date with the player's guess."""
+        guess = self.guess
+        changes = guess.changes
+        if self.seen <= len(changes) and (self.seen == 0 or changes[self.seen - 1] is self.last):
+            changed = [index for index, old, cell in changes[self.seen:]]
         else:
-            print("""
+            cells = self.work.cells
+            changed = [index for index, cell in enumerate(guess.cells) if cell != cells[index]]
+        for index in changed:
+            self.work.put(index, guess.cells[index])
+            self.propagator.touch(index)
+        self.seen = len(changes)
+        self.last = changes[-1] if changes else None
+
+    def hint(self):
+        """Find the next square that can be deduced from the guess as it is.
+
+        Returns:
+            (rule, row, col, cell) - The square, the CELL_* code it
+            must have, and the name of the rule in RULES that says so.
+            None if nothing more can be deduced, or if the guess
+            cannot be right, which sets mistake.
+        """
+        self.follow()
+        work = self.work
+        propagator = self.propagator
+        snapshot = work.snapshot()
+        self.found = None
+        self.mistake = False
+        while self.found is None:
+            done = propagator.step()
+            if done is None:
+                return None
+            if propagator.conflict:
+                # Keep it queued for when the player has fixed things
+                propagator.conflict = False
+                self.mistake = True
+                self.requeue(done)
+                work.rollback(snapshot)
+                return None
+
+        # Take the deductions back: they are the player's to make
+        changes = work.changes[snapshot:]
+        work.rollback(snapshot)
+        for index, old, cell in changes:
+            propagator.touch(index)
+        self.requeue(done)
+        return self.found
+
+    def requeue(self, done):
+        kind, item = done
+        if kind == 'square':
+            self.propagator.queue_square(item)
+        elif kind == 'row':
+            self.propagator.queue_row(item)
+        elif kind == 'col':
+            self.propagator.queue_col(item)
+
+
+# What play() and the game server show for a key they do not know
+HELP = """
 Please type one of:
     # - Move the cursor in that direction
     ~ - Place an 'empty' marker at the current square
     ^ - Place a 'tent' marker at the current square
+    s - Solve as much as can be deduced
+    n - Fill in the next square that can be deduced, and say why
+    ? - Reveal the current square
+    u - Undo the last move
+    r - Redo the move just undone
     h - Hint
     q - Quit
-""")
+"""
+
+# The keys of a number pad, and the way each one moves the cursor
+CURSOR_MOVES = {
+    '1': [1, -1],
+    '2': [1, 0],
+    '3': [1, 1],
+    '4': [0, -1],
+    '6': [0, 1],
+    '7': [-1, -1],
+    '8': [-1, 0],
+    '9': [-1, 1],
+}
+
+
+class Game:
+    """One player's game: the puzzle, their guesses and their cursor.
+
+    play() drives a Game from the keyboard, and tree_game_server
+    drives one per connection. Showing the board, hints and quitting
+    are left to them.
+
+    Attributes:
+        board  - The board, with its tents
+        guess  - The player's GuessBoard
+        cursor - [row, col] of the square the player is on
+        moves  - The guess's snapshot from before each move, for undo
+        hints  - The HintEngine, made the first time it is needed
+    """
+    __slots__ = ('board', 'guess', 'cursor', 'moves', 'hints')
+
+    def __init__(self, board):
+        self.board = board
+        self.guess = GuessBoard.from_puzzle(board)
+        fill_empty(board, self.guess)
+        self.cursor = [0, 0]
+        self.moves = []
+        self.hints = None
+
+    def command(self, key):
+        """Carry out one of the player's keys.
+
+        Args:
+            key - One of the keys in HELP, other than h and q
+
+        Returns:
+            A message for the player, or '' if there is none
+        """
+        board = self.board
+        guess = self.guess
+        row, col = self.cursor
+        snapshot = guess.snapshot()
+        message = ''
+
+        if key == 'u':
+            if self.moves:
+                guess.rollback(self.moves.pop())
+        elif key == 'r':
+            if guess.redo():
+                self.moves.append(snapshot)
+        elif key == 's':
+            solver(board, guess)
+        elif key == 'n':
+            if self.hints is None:
+                self.hints = HintEngine(board, guess)
+            found = self.hints.hint()
+            if found is not None:
+                rule, row, col, cell = found
+                guess.put(guess.index(row, col), cell)
+                self.cursor = [row, col]
+                message = '%s at %d,%d: %s' % ('Tent' if cell == CELL_TENT else 'Empty', row, col, RULE_HINTS[rule])
+            elif self.hints.mistake:
+                message = 'Something is not right, try undoing a move'
+            else:
+                message = 'Nothing more can be deduced'
+        elif key == '?':
+            if board[row][col] == BOARD_TENT:
+                set(guess, row, col, BOARD_TENT)
+            if board[row][col] == BOARD_EMPTY:
+                set(guess, row, col, BOARD_EMPTY_GUESS)
+        elif key in ['~', '^']:
+            if get(guess, row, col) == BOARD_TREE:
+                message = 'Please do not cut down the trees!'
+            else:
+                set(guess, row, col, key)
+        elif key in CURSOR_MOVES:
+            # Moving off one edge comes back on at the other
+            self.cursor = [(row + CURSOR_MOVES[key][0]) % board.rows, (col + CURSOR_MOVES[key][1]) % board.cols]
+        else:
+            message = HELP
+
+        if key in ['s', 'n', '?', '~', '^'] and guess.snapshot() != snapshot:
+            self.moves.append(snapshot)
+        return message
+
+
+def read_key():
+    """Read the player's next key.
+
+    On Windows a single key press is read with msvcrt. Elsewhere a
+    whole line is read, and its first character is the key.
+
+    Returns:
+        The key, or '' if there was none
+    """
+    if msvcrt is not None:
+        return msvcrt.getch().decode(errors='replace').strip()
+    line = input().strip()
+    return line[:1]
+
+
+def play(pool=None):
+    """Play the game. Let the user try to solve it.
+
+    Args:
+        pool - Optional, a tree_game_gen.PuzzlePool to take the
+               puzzle from, so the game starts without waiting
+
+    Returns:
+        none
+    """
+    if pool is not None:
+        board = pool.get(6, 6, 40)
+    else:
+        board = generate_puzzle(6, 6, density=40, verbose=True)
+    game = Game(board)
+    renderer = BoardRenderer(board)
+    message = ''
+
+    while True:
+        renderer.draw(game.guess, cursor=game.cursor, message=message)
+        message = ''
+        if game.guess.is_solved():
+            print('\nYou solved it. Great work!')
+            break
+        print('Your turn [1-9, ~, ^, s, n, ?, u, r, h, q]: ')
+        key = read_key()
+        if not key:
+            continue
+        if key == 'q':
+            break
+        if key == 'h':
+            print_board(board, cursor=game.cursor)
+            print('Press a key to go back to your board')
+            read_key()
+            renderer.reset()
+            continue
+        message = game.command(key)
 
     print_board(board)
@@ -0,0 +1,204 @@
+import numpy as np
+
+import tree_game_lib
+
+# A NumPy version of the board engine. Boards and guesses are int8
+# arrays of the CELL_* codes in tree_game_lib, either one board of
+# shape (rows, cols) or a stack of boards of shape (n, rows, cols).
+# Every rule is applied to the whole stack at once with shifted
+# copies of the arrays, instead of square by square.
+#
+# Creating a board stays in tree_game_lib: each tree and tent that
+# create_board() places depends on the ones placed before it.
+
+
+def to_array(board):
+    """Convert a board into an int8 array of CELL_* codes.
+
+    Args:
+        board - A Board or a list of lists board
+
+    Returns:
+        An array of shape (rows, cols)
+    """
+    board = tree_game_lib.as_board(board)
+    cells = np.frombuffer(board.cells, dtype=np.int8).reshape(board.rows + 2, board.stride)
+    return cells[1:-1, 1:-1].copy()
+
+
+def from_array(array):
+    """Convert an int8 array of CELL_* codes back into a Board.
+
+    Args:
+        array - An array of shape (rows, cols)
+
+    Returns:
+        A new Board
+    """
+    rows, cols = array.shape
+    board = tree_game_lib.Board(rows, cols)
+    for row in range(rows):
+        start = board.row_start[row]
+        board.cells[start:start + cols] = array[row].astype(np.int8).tobytes()
+    board.recount()
+    return board
+
+
+def stack(boards):
+    """Stack boards of the same size into one array of shape (n, rows, cols)."""
+    return np.stack([to_array(board) for board in boards])
+
+
+def unstack(boards):
+    """Split an array of shape (n, rows, cols) back into a list of Boards."""
+    return [from_array(board) for board in boards]
+
+
+def _as_stack(array):
+    """View a single board as a stack of one."""
+    if array.ndim == 2:
+        return array[np.newaxis]
+    return array
+
+
+def _pad(mask):
+    """Pad the rows and cols of a stack of masks with False."""
+    return np.pad(mask, ((0, 0), (1, 1), (1, 1)))
+
+
+def adjacent_count(mask):
+    """For each square, how many of the 4 squares next to it are set in mask."""
+    padded = _pad(mask).astype(np.int8)
+    return padded[:, :-2, 1:-1] + padded[:, 2:, 1:-1] + padded[:, 1:-1, :-2] + padded[:, 1:-1, 2:]
+
+
+def adjacent_any(mask):
+    """For each square, is any of the 4 squares next to it set in mask."""
+    padded = _pad(mask)
+    return padded[:, :-2, 1:-1] | padded[:, 2:, 1:-1] | padded[:, 1:-1, :-2] | padded[:, 1:-1, 2:]
+
+
+def around_any(mask):
+    """For each square, is it or any of the 8 squares around it set in mask."""
+    padded = _pad(mask)
+    rows, cols = mask.shape[1:]
+    result = np.zeros_like(mask)
+    for r in range(3):
+        for c in range(3):
+            result |= padded[:, r:r + rows, c:c + cols]
+    return result
+
+
+def clues(boards):
+    """The number of tents in each row and col of each board.
+
+    Args:
+        boards - A stack of boards, with their tents
+
+    Returns:
+        (row_tents, col_tents) - Arrays of shape (n, rows) and (n, cols)
+    """
+    tents = _as_stack(boards) == tree_game_lib.CELL_TENT
+    return tents.sum(axis=2), tents.sum(axis=1)
+
+
+def create_guess_boards(boards):
+    """A copy of a stack of boards with the tents replaced by empty."""
+    guesses = boards.copy()
+    guesses[guesses == tree_game_lib.CELL_TENT] = tree_game_lib.CELL_EMPTY
+    return guesses
+
+
+def fill_empty(boards, guesses):
+    """Mark the squares that obviously cannot hold a tent, on every board at once.
+
+    The same rules as tree_game_lib.fill_empty(): a row or col that
+    has all its tents has no more, and a square with no tree next to
+    it cannot have a tent.
+
+    Args:
+        boards  - A board or stack of boards, with their tents
+        guesses - The matching guesses, changed in place
+
+    Returns:
+        none
+    """
+    boards = _as_stack(boards)
+    guesses = _as_stack(guesses)
+    row_tents, col_tents = clues(boards)
+
+    tents = guesses == tree_game_lib.CELL_TENT
+    row_full = tents.sum(axis=2) == row_tents
+    col_full = tents.sum(axis=1) == col_tents
+    no_tree = ~adjacent_any(guesses == tree_game_lib.CELL_TREE)
+
+    marked = (guesses == tree_game_lib.CELL_EMPTY) & (row_full[:, :, np.newaxis] | col_full[:, np.newaxis, :] | no_tree)
+    guesses[marked] = tree_game_lib.CELL_EMPTY_GUESS
+
+
+def solver(boards, guesses):
+    """Fill in as much of every guess as the deduction rules allow.
+
+    Each pass applies the rules of tree_game_lib.solver() in turn,
+    each one to every square of every board at once, until a pass
+    changes nothing on any board. For guesses that agree with their
+    boards the result is the same as tree_game_lib.solver().
+
+    Args:
+        boards  - A board or stack of boards, with their tents
+        guesses - The matching guesses, changed in place
+
+    Returns:
+        The number of passes made
+    """
+    boards = _as_stack(boards)
+    guesses = _as_stack(guesses)
+    row_tents, col_tents = clues(boards)
+    tree = guesses == tree_game_lib.CELL_TREE
+    trees_next_to = adjacent_count(tree)
+
+    passes = 0
+    while True:
+        passes += 1
+        before = guesses.copy()
+
+        # A row or col whose empty squares are all the tents it is missing
+        empty = guesses == tree_game_lib.CELL_EMPTY
+        have = (guesses == tree_game_lib.CELL_TENT).sum(axis=2)
+        row_done = have + empty.sum(axis=2) == row_tents
+        guesses[empty & row_done[:, :, np.newaxis]] = tree_game_lib.CELL_TENT
+
+        empty = guesses == tree_game_lib.CELL_EMPTY
+        have = (guesses == tree_game_lib.CELL_TENT).sum(axis=1)
+        col_done = have + empty.sum(axis=1) == col_tents
+        guesses[empty & col_done[:, np.newaxis, :]] = tree_game_lib.CELL_TENT
+
+        # A tree that has no tents around it and only one empty adjacent square
+        empty = guesses == tree_game_lib.CELL_EMPTY
+        lonely = tree & (adjacent_count(empty) == 1) & ~adjacent_any(guesses == tree_game_lib.CELL_TENT)
+        guesses[empty & adjacent_any(lonely)] = tree_game_lib.CELL_TENT
+
+        # A square that has a tent cannot have tents around it
+        tent = guesses == tree_game_lib.CELL_TENT
+        guesses[(guesses == tree_game_lib.CELL_EMPTY) & around_any(tent)] = tree_game_lib.CELL_EMPTY_GUESS
+
+        # If a tent has only one tree near it, the empty squares around
+        # that tree that touch no other tree cannot have tents
+        claimed = tree & adjacent_any(tent & (trees_next_to == 1))
+        pruned = (guesses == tree_game_lib.CELL_EMPTY) & (trees_next_to == 1) & adjacent_any(claimed)
+        guesses[pruned] = tree_game_lib.CELL_EMPTY_GUESS
+
+        if np.array_equal(before, guesses):
+            return passes
+
+
+def solved(boards, guesses):
+    """Which guesses have exactly the tents of their boards.
+
+    Returns:
+        A bool array with one entry per board
+    """
+    boards = _as_stack(boards)
+    guesses = _as_stack(guesses)
+    same = (boards == tree_game_lib.CELL_TENT) == (guesses == tree_game_lib.CELL_TENT)
+    return same.all(axis=(1, 2))
@@ -0,0 +1,175 @@
+import argparse
+import mmap
+import struct
+import sys
+from array import array
+
+import tree_game_gen
+import tree_game_lib
+
+# A puzzle pack is a file of many boards, each stored with 2 bits per
+# square (the CELL_* codes of tree_game_lib), so a puzzle and its
+# solution take a quarter of a byte per square. The file is:
+#
+#   header  - HEADER: MAGIC, VERSION, the number of boards, and where
+#             the index starts
+#   boards  - one after the other, each a BOARD_HEADER with its rows
+#             and cols followed by its squares, 4 to a byte, row by row
+#   index   - count + 1 little endian 64 bit offsets, where board n is
+#             the bytes from offset n up to offset n + 1
+#
+# The index goes at the end so a pack can be written as the boards
+# are generated, without knowing how many there will be. Opening a
+# pack maps the file into memory and only reads the board asked for.
+
+MAGIC = b'MTPK'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQQ')
+BOARD_HEADER = struct.Struct('<HH')
+
+# The 4 squares each possible byte holds
+_UNPACKED = [bytes([byte & 3, byte >> 2 & 3, byte >> 4 & 3, byte >> 6]) for byte in range(256)]
+
+
+def pack_board(board):
+    """Pack a board into bytes, 2 bits per square.
+
+    Args:
+        board - A Board or a list of lists board
+
+    Returns:
+        The bytes, starting with the rows and cols of the board
+    """
+    board = tree_game_lib.as_board(board)
+    squares = b''.join(board.cells[start:start + board.cols] for start in board.row_start)
+    squares += bytes(-len(squares) % 4)
+    packed = bytes(a | b << 2 | c << 4 | d << 6
+                   for a, b, c, d in zip(squares[0::4], squares[1::4], squares[2::4], squares[3::4]))
+    return BOARD_HEADER.pack(board.rows, board.cols) + packed
+
+
+def unpack_board(data, offset=0):
+    """Unpack a board that pack_board() packed.
+
+    Args:
+        data   - bytes, or anything else that can be sliced like bytes
+        offset - Where in data the packed board starts
+
+    Returns:
+        A new Board
+    """
+    rows, cols = BOARD_HEADER.unpack_from(data, offset)
+    offset += BOARD_HEADER.size
+    squares = b''.join([_UNPACKED[byte] for byte in data[offset:offset + (rows * cols + 3) // 4]])
+
+    board = tree_game_lib.Board(rows, cols)
+    for row, start in enumerate(board.row_start):
+        board.cells[start:start + cols] = squares[row * cols:(row + 1) * cols]
+    board.recount()
+    return board
+
+
+def write_pack(path, boards):
+    """Write boards into a puzzle pack file.
+
+    Args:
+        path   - The file to write
+        boards - Any iterable of Boards or list of lists boards, which
+                 is only read once, so it can be a generator
+
+    Returns:
+        The number of boards written
+    """
+    offsets = array('Q')
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, 0, 0, 0))
+        offset = HEADER.size
+        for board in boards:
+            data = pack_board(board)
+            offsets.append(offset)
+            f.write(data)
+            offset += len(data)
+        offsets.append(offset)
+
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+        f.write(offsets.tobytes())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, 0, len(offsets) - 1, offset))
+    return len(offsets) - 1
+
+
+class PuzzlePack:
+    """A puzzle pack file, opened for reading any board in it.
+
+    The file is memory mapped, so opening it reads only the header,
+    and pack[n] reads only the index entry and the bytes of board n.
+
+    Attributes:
+        file  - The open pack file
+        data  - The file, mapped into memory
+        count - The number of boards in the pack
+        index - Where in the file the index starts
+    """
+    __slots__ = ('file', 'data', 'count', 'index')
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped
+            self.file.close()
+            raise ValueError("%s is not a puzzle pack" % path)
+        if len(self.data) < HEADER.size:
+            magic = version = None
+        else:
+            magic, version, reserved, self.count, self.index = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("%s is not a version %d puzzle pack" % (path, VERSION))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += self.count
+        if n < 0 or n >= self.count:
+            raise IndexError("puzzle %d is outside range 0..%d" % (n, self.count - 1))
+        offset, = struct.unpack_from('<Q', self.data, self.index + 8 * n)
+        return unpack_board(self.data, offset)
+
+    def __iter__(self):
+        for n in range(self.count):
+            yield self[n]
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a pack of Maine Trees puzzles.')
+    parser.add_argument('path', help='the pack file to write')
+    parser.add_argument('count', type=int, help='how many puzzles to generate')
+    parser.add_argument('--rows', type=int, default=10)
+    parser.add_argument('--cols', type=int, default=10)
+    parser.add_argument('--density', type=int, default=40)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--workers', type=int)
+    args = parser.parse_args()
+
+    puzzles = tree_game_gen.generate_puzzles(args.count, args.rows, args.cols, density=args.density,
+                                             workers=args.workers, seed=args.seed)
+    print("Wrote %d puzzles" % write_pack(args.path, (board for name, board in puzzles)))
+
+
+if __name__ == '__main__':
+    main()
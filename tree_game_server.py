@@ -0,0 +1,246 @@
+import argparse
+import asyncio
+import functools
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import tree_game_gen
+import tree_game_lib
+
+# A game server: every connection gets its own puzzle and plays it by
+# sending the keys of play(), one per line. After each key the server
+# answers with a line 'OK n' followed by n lines: the board, and any
+# message for the player. The connection is closed after 'q' or once
+# the puzzle is solved, or with a line 'ERR' and the reason after a
+# line longer than the reader's limit.
+#
+# Puzzles are generated in an executor, so a slow puzzle never holds
+# up the other players, and can be taken ready made from a PuzzlePool.
+
+
+def reply(writer, text):
+    """Send a reply of any number of lines."""
+    lines = text.rstrip('\n').split('\n') if text else []
+    writer.write(('OK %d\n' % len(lines) + ''.join(line + '\n' for line in lines)).encode())
+
+
+def show(game, message=''):
+    """The board as the player has it, with a message after it."""
+    text = tree_game_lib.BoardRenderer(game.board).frame(game.guess, game.cursor)
+    return text + message
+
+
+class GameServer:
+    """Serve games of Maine Trees, one per connection.
+
+    Attributes:
+        rows     - The number of rows on each puzzle
+        cols     - The number of cols on each puzzle
+        density  - The density of trees as a percentage (0-100)
+        executor - Where puzzles are generated, None for the event
+                   loop's default thread pool
+        pool     - Optional, a tree_game_gen.PuzzlePool to take
+                   puzzles from before generating one
+        sessions - How many games are being played right now
+        played   - How many games have been started
+    """
+    __slots__ = ('rows', 'cols', 'density', 'executor', 'pool', 'sessions', 'played')
+
+    def __init__(self, rows=6, cols=6, density=40, executor=None, pool=None):
+        self.rows = rows
+        self.cols = cols
+        self.density = density
+        self.executor = executor
+        self.pool = pool
+        self.sessions = 0
+        self.played = 0
+
+    async def new_game(self):
+        """Take a puzzle from the pool, or generate one without blocking the event loop."""
+        board = None
+        if self.pool is not None:
+            board = self.pool.take(self.rows, self.cols, self.density)
+        if board is None:
+            board = await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(tree_game_lib.generate_puzzle, self.rows, self.cols, self.density,
+                                                 verbose=False, rng=random.randrange(2 ** 32)))
+        return tree_game_lib.Game(board)
+
+    async def session(self, reader, writer):
+        """Play one game with one connection."""
+        self.sessions += 1
+        self.played += 1
+        try:
+            game = await self.new_game()
+            reply(writer, show(game))
+            await writer.drain()
+            while True:
+                try:
+                    line = await reader.readline()
+                except ValueError:
+                    # readline() turns asyncio.LimitOverrunError into this
+                    writer.write(b'ERR line too long\n')
+                    break
+                if not line:
+                    break
+                key = line.decode(errors='replace').strip()[:1]
+                if key == 'q':
+                    reply(writer, tree_game_lib.BoardRenderer(game.board).frame())
+                    break
+                if key == 'h':
+                    reply(writer, tree_game_lib.BoardRenderer(game.board).frame(cursor=game.cursor))
+                elif key:
+                    if key == 's':
+                        # The solver can take a while on a big board, so
+                        # run it on a thread and let the other games go
+                        # on. It changes the game in place, which a
+                        # process pool executor would only do to a copy.
+                        message = await asyncio.get_running_loop().run_in_executor(None, game.command, key)
+                    else:
+                        message = game.command(key)
+                    if game.guess.is_solved():
+                        reply(writer, show(game, 'You solved it. Great work!'))
+                        break
+                    reply(writer, show(game, message))
+                else:
+                    reply(writer, show(game))
+                await writer.drain()
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=0, path=None, backlog=1024):
+        """Start listening, on a Unix socket if path is given, otherwise on TCP.
+
+        Args:
+            host    - The address to listen on
+            port    - The TCP port, 0 for any free one
+            path    - Optional, a Unix socket to listen on instead
+            backlog - How many connections can wait to be accepted.
+                      Hundreds of players connecting at once would
+                      overflow asyncio's default of 100.
+
+        Returns:
+            The asyncio Server
+        """
+        if path is not None:
+            return await asyncio.start_unix_server(self.session, path=path, backlog=backlog)
+        return await asyncio.start_server(self.session, host, port, backlog=backlog)
+
+
+async def read_reply(reader):
+    """Read one reply from the server.
+
+    Returns:
+        The lines of the reply, or None if the connection closed or
+        the server refused the line sent
+    """
+    header = await reader.readline()
+    if not header or header.startswith(b'ERR'):
+        return None
+    count = int(header.split()[1])
+    return [(await reader.readline()).decode().rstrip('\n') for i in range(count)]
+
+
+async def play_randomly(host, port, path, moves, rng):
+    """Connect and play moves random keys, as a stand in for a player.
+
+    Returns:
+        The seconds each reply took
+    """
+    if path is not None:
+        reader, writer = await asyncio.open_unix_connection(path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    latencies = []
+    try:
+        start = time.perf_counter()
+        await read_reply(reader)
+        latencies.append(time.perf_counter() - start)
+        for move in range(moves):
+            writer.write((rng.choice('12346789~^?u') + '\n').encode())
+            start = time.perf_counter()
+            await writer.drain()
+            if await read_reply(reader) is None:
+                break
+            latencies.append(time.perf_counter() - start)
+        writer.write(b'q\n')
+        await writer.drain()
+        await read_reply(reader)
+    finally:
+        writer.close()
+    return latencies
+
+
+async def load_test(host='127.0.0.1', port=0, path=None, clients=100, moves=50, seed=None):
+    """Play many games against a server at once and time the replies.
+
+    Args:
+        host    - The server's host
+        port    - The server's TCP port
+        path    - Optional, the server's Unix socket instead
+        clients - How many games to play at the same time
+        moves   - How many keys each client sends
+        seed    - Optional, makes the clients' keys repeatable
+
+    Returns:
+        A dict with the number of replies, the seconds taken, and the
+        mean and worst seconds per reply
+    """
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    results = await asyncio.gather(*[play_randomly(host, port, path, moves, random.Random(rng.random()))
+                                     for i in range(clients)])
+    seconds = time.perf_counter() - start
+    latencies = [latency for result in results for latency in result]
+    return {
+        'clients': clients,
+        'replies': len(latencies),
+        'seconds': seconds,
+        'mean': sum(latencies) / len(latencies) if latencies else 0.0,
+        'worst': max(latencies, default=0.0),
+    }
+
+
+async def serve(args):
+    executor = ProcessPoolExecutor(args.workers) if args.workers else None
+    pool = None
+    if args.pool:
+        pool = tree_game_gen.PuzzlePool(low=args.pool // 4, high=args.pool, max_configs=1, executor=executor)
+        pool.warm(args.rows, args.cols, args.density)
+    game_server = GameServer(args.rows, args.cols, args.density, executor=executor, pool=pool)
+    server = await game_server.start(args.host, args.port, args.path)
+    print('Serving on %s' % ', '.join(str(sock.getsockname()) for sock in server.sockets))
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Maine Trees games, or load test a server.')
+    parser.add_argument('mode', choices=['serve', 'load'])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8642)
+    parser.add_argument('--path', help='use this Unix socket instead of TCP')
+    parser.add_argument('--rows', type=int, default=6)
+    parser.add_argument('--cols', type=int, default=6)
+    parser.add_argument('--density', type=int, default=40)
+    parser.add_argument('--workers', type=int, help='generate puzzles on this many processes')
+    parser.add_argument('--pool', type=int, default=32, help='keep this many puzzles ready, 0 for none')
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--moves', type=int, default=50)
+    args = parser.parse_args()
+
+    if args.mode == 'serve':
+        asyncio.run(serve(args))
+    else:
+        result = asyncio.run(load_test(args.host, args.port, args.path, args.clients, args.moves))
+        print("%(clients)d clients, %(replies)d replies in %(seconds).2fs, "
+              "%(mean).4fs mean and %(worst).4fs worst per reply" % result)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,20 @@
+import asyncio
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+import tree_game_bench
+import tree_game_bitboard
+import tree_game_cache
+import tree_game_gen
 import tree_game_lib
+import tree_game_pack
+import tree_game_server
 
 board1 = [
     [tree_game_lib.BOARD_TREE, tree_game_lib.BOARD_TREE, tree_game_lib.BOARD_EMPTY],
@@ -33,6 +49,13 @@ def test_validate():
         print("validate(board1, col=len(board1[0])) returned, expected OutOfRange exception")
         return False
 
+    # row 0 and col 0 are on the board
+    try:
+        tree_game_lib.validate(board1, row=0, col=0)
+    except tree_game_lib.OutOfRange:
+        print("validate(board1, row=0, col=0) raised OutOfRange, expected it to return")
+        return False
+
     # Neither row nor col are set
     try:
         tree_game_lib.validate(board1)
@@ -56,6 +79,13 @@ def test_get():
         print("get(board1, 0, 0) returned %s, expected %s" % (square, board1[0][0]))
         return False
 
+    board = tree_game_lib.Board.from_lists(board1)
+    for r, c in [[-1, 0], [0, -1], [len(board1), 0], [0, len(board1[0])], [-5, -5]]:
+        square = tree_game_lib.get(board, r, c)
+        if square != tree_game_lib.BOARD_OUT_OF_BOUNDS:
+            print("get(Board, %d, %d) returned %s, expected BOARD_OUT_OF_BOUNDS" % (r, c, square))
+            return False
+
     return True
 
 
@@ -153,6 +183,903 @@ def test_place_tree_and_tent():
     return True
 
 
+def test_board():
+    board = tree_game_lib.Board.from_lists(board1)
+
+    if len(board) != len(board1) or len(board[0]) != len(board1[0]):
+        print("Board.from_lists(board1) is %dx%d, expected %dx%d" % (len(board), len(board[0]), len(board1), len(board1[0])))
+        return False
+
+    if board.to_lists() != board1:
+        print("Board.from_lists(board1).to_lists() != board1")
+        return False
+
+    for r in range(len(board1)):
+        for c in range(len(board1[0])):
+            if board[r][c] != board1[r][c]:
+                print("board[%d][%d] returned %s, expected %s" % (r, c, board[r][c], board1[r][c]))
+                return False
+
+    board[2][1] = tree_game_lib.BOARD_TREE
+    if tree_game_lib.get(board, 2, 1) != tree_game_lib.BOARD_TREE:
+        print("board[2][1] = BOARD_TREE did not change the board")
+        return False
+
+    if tree_game_lib.count_tents(board, row=3) != 3 or tree_game_lib.count_tents(board, col=0) != 3:
+        print("count_tents(Board) does not match count_tents(list of lists)")
+        return False
+
+    return True
+
+
+def test_journal_board():
+    board = tree_game_lib.create_board(6, 6, rng=4)
+    guess = tree_game_lib.JournalBoard.from_board(tree_game_lib.create_guess_board(board))
+    start = guess.to_lists()
+    snapshot = guess.snapshot()
+
+    tree_game_lib.solver(board, guess)
+    solved = guess.to_lists()
+    if guess.snapshot() == snapshot:
+        print("JournalBoard did not record the solver's changes")
+        return False
+
+    guess.rollback(snapshot)
+    if guess.to_lists() != start or guess.row_counts != tree_game_lib.Board.from_lists(start).row_counts:
+        print("JournalBoard.rollback() did not restore the board")
+        return False
+
+    if not guess.redo() or guess.to_lists() != solved or guess.redo():
+        print("JournalBoard.redo() did not make the changes again exactly once")
+        return False
+
+    guess.rollback(snapshot)
+    guess.set_cell(0, 0, tree_game_lib.CELL_EMPTY_GUESS)
+    if guess.redo():
+        print("JournalBoard.redo() redid changes after a new change")
+        return False
+
+    if type(guess.copy()) is not tree_game_lib.Board:
+        print("JournalBoard.copy() did not make a plain Board")
+        return False
+
+    return True
+
+
+def test_guess_board():
+    board = tree_game_lib.create_board(7, 7, rng=2)
+    guess = tree_game_lib.GuessBoard.from_puzzle(board)
+    rng = random.Random(2)
+    for move in range(300):
+        row = rng.randrange(7)
+        col = rng.randrange(7)
+        if guess.get_cell(row, col) != tree_game_lib.CELL_TREE:
+            guess.set_cell(row, col, rng.choice([tree_game_lib.CELL_TENT, tree_game_lib.CELL_EMPTY_GUESS]))
+        if move % 50 == 49:
+            guess.rollback(max(guess.snapshot() - 10, 0))
+        if guess.is_solved() != tree_game_lib.solved(board, guess):
+            print("GuessBoard.is_solved() disagrees with solved() after move %d" % move)
+            return False
+
+    snapshot = guess.snapshot()
+    for row in range(7):
+        for col in range(7):
+            if board[row][col] == tree_game_lib.BOARD_TENT:
+                guess[row][col] = tree_game_lib.BOARD_TENT
+            elif guess[row][col] == tree_game_lib.BOARD_TENT:
+                guess[row][col] = tree_game_lib.BOARD_EMPTY_GUESS
+    if not guess.is_solved():
+        print("GuessBoard.is_solved() missed the solution")
+        return False
+    guess.rollback(snapshot)
+    guess.redo()
+    if not guess.is_solved():
+        print("GuessBoard.is_solved() missed the solution after undo and redo")
+        return False
+
+    boards = [tree_game_lib.create_board(5, 5, rng=seed) for seed in range(10)]
+    guesses = [board.copy() for board in boards]
+    if tree_game_lib.solved_each(boards, guesses) != [True] * 10:
+        print("solved_each() did not find every board solved by itself")
+        return False
+    guesses[3] = tree_game_lib.create_guess_board(boards[3])
+    expected = [True] * 10
+    expected[3] = not any(boards[3].row_counts[tree_game_lib.CELL_TENT])
+    if tree_game_lib.solved_each(boards, guesses) != expected:
+        print("solved_each() did not find the one unsolved guess")
+        return False
+
+    return True
+
+
+def test_board_counts():
+    random.seed(3)
+    board = tree_game_lib.create_board(12, 15, density=40)
+    guess = tree_game_lib.create_guess_board(board)
+    tree_game_lib.fill_empty(board, guess)
+    tree_game_lib.solver(board, guess)
+
+    for b in [board, guess]:
+        squares = b.to_lists()
+        for match in [tree_game_lib.BOARD_TENT, tree_game_lib.BOARD_TREE, tree_game_lib.BOARD_EMPTY, tree_game_lib.BOARD_EMPTY_GUESS]:
+            for r in range(len(squares)):
+                if tree_game_lib.count_tents(b, row=r, match=match) != tree_game_lib.count_tents(squares, row=r, match=match):
+                    print("count_tents(Board, row=%d, match=%s) is out of date" % (r, match))
+                    return False
+            for c in range(len(squares[0])):
+                if tree_game_lib.count_tents(b, col=c, match=match) != tree_game_lib.count_tents(squares, col=c, match=match):
+                    print("count_tents(Board, col=%d, match=%s) is out of date" % (c, match))
+                    return False
+
+    return True
+
+
+def test_solver():
+    for seed in range(100):
+        random.seed(seed)
+        board = tree_game_lib.create_board(8, 10, density=[20, 40, 60][seed % 3])
+
+        guess = tree_game_lib.create_guess_board(board)
+        tree_game_lib.fill_empty(board, guess)
+        tree_game_lib.solver(board, guess)
+
+        sweep = tree_game_lib.create_guess_board(board)
+        tree_game_lib.fill_empty(board, sweep)
+        tree_game_lib.solver_sweep(board, sweep)
+
+        if guess.to_lists() != sweep.to_lists():
+            print("solver() and solver_sweep() disagree on the board for seed %d" % seed)
+            return False
+
+    return True
+
+
+def test_solver_matching():
+    local = 0
+    matched = 0
+    for seed in range(100):
+        random.seed(seed)
+        board = tree_game_lib.create_board(8, 8, density=40)
+
+        guess = tree_game_lib.create_guess_board(board)
+        tree_game_lib.fill_empty(board, guess)
+        tree_game_lib.solver(board, guess, matching=True)
+
+        # Everything it decided must agree with the board
+        for r in range(len(board)):
+            for c in range(len(board[0])):
+                if guess[r][c] == tree_game_lib.BOARD_TENT and board[r][c] != tree_game_lib.BOARD_TENT or \
+                        guess[r][c] == tree_game_lib.BOARD_EMPTY_GUESS and board[r][c] == tree_game_lib.BOARD_TENT:
+                    print("solver(matching=True) got square %d,%d wrong for seed %d" % (r, c, seed))
+                    return False
+        if tree_game_lib.solved(board, guess):
+            matched += 1
+
+        guess = tree_game_lib.create_guess_board(board)
+        tree_game_lib.fill_empty(board, guess)
+        tree_game_lib.solver(board, guess)
+        if tree_game_lib.solved(board, guess):
+            local += 1
+
+    if matched < local:
+        print("solver(matching=True) solved %d boards, solver() solved %d" % (matched, local))
+        return False
+
+    return True
+
+
+def test_solver_stats():
+    for seed in range(20):
+        random.seed(seed)
+        board = tree_game_lib.create_board(8, 8, density=40)
+
+        plain = tree_game_lib.create_guess_board(board)
+        tree_game_lib.fill_empty(board, plain)
+        tree_game_lib.solver(board, plain, matching=True)
+
+        stats = tree_game_lib.SolverStats()
+        steps = []
+        guess = tree_game_lib.create_guess_board(board)
+        tree_game_lib.fill_empty(board, guess)
+        tree_game_lib.solver(board, guess, matching=True, stats=stats,
+                             trace=lambda rule, row, col, cell: steps.append([rule, row, col, cell]))
+
+        # Counting must not change what the solver does
+        if guess.to_lists() != plain.to_lists():
+            print("solver(stats=...) filled in a different board for seed %d" % seed)
+            return False
+
+        # Every square the trace reports is filled in, once, by a known rule
+        decided = 0
+        for rule, row, col, cell in steps:
+            if rule not in tree_game_lib.RULES or guess.get_cell(row, col) != cell:
+                print("solver() traced %s at %d,%d that is not on the board for seed %d" % (rule, row, col, seed))
+                return False
+        for rule in tree_game_lib.RULES:
+            decided += stats.decided[rule]
+            if stats.decided[rule] != len([step for step in steps if step[0] == rule]):
+                print("SolverStats.decided[%r] does not match the trace for seed %d" % (rule, seed))
+                return False
+        if decided != len(steps) or stats.steps != sum(stats.examined.values()):
+            print("SolverStats totals do not add up for seed %d" % seed)
+            return False
+
+    stats = tree_game_lib.SolverStats()
+    tree_game_lib.count_solutions(board, stats=stats)
+    if stats.as_dict()['rules']['row']['examined'] == 0:
+        print("count_solutions(stats=...) counted nothing")
+        return False
+
+    return True
+
+
+def test_count_solutions():
+    # The two tents can swap trees: (0,1)+(2,2) or (0,2)+(2,1)
+    board = [
+        [tree_game_lib.BOARD_EMPTY, tree_game_lib.BOARD_TENT, tree_game_lib.BOARD_EMPTY],
+        [tree_game_lib.BOARD_EMPTY, tree_game_lib.BOARD_TREE, tree_game_lib.BOARD_TREE],
+        [tree_game_lib.BOARD_EMPTY, tree_game_lib.BOARD_EMPTY, tree_game_lib.BOARD_TENT],
+    ]
+    count = tree_game_lib.count_solutions(board, limit=10)
+    if count != 2:
+        print("count_solutions(board) returned %d, expected 2" % count)
+        return False
+
+    # A single tree in a corner can only use one square
+    board = [
+        [tree_game_lib.BOARD_TREE, tree_game_lib.BOARD_TENT],
+        [tree_game_lib.BOARD_EMPTY, tree_game_lib.BOARD_EMPTY],
+    ]
+    count = tree_game_lib.count_solutions(board, limit=10)
+    if count != 1:
+        print("count_solutions(board) returned %d, expected 1" % count)
+        return False
+
+    for seed in range(50):
+        random.seed(seed)
+        board = tree_game_lib.create_board(7, 7, density=40)
+        solutions = tree_game_lib.find_solutions(board, limit=2)
+        if not solutions:
+            print("find_solutions(board) found no solutions for seed %d, expected the board's own" % seed)
+            return False
+        if len(solutions) == 1 and not tree_game_lib.solved(board, solutions[0]):
+            print("find_solutions(board) found a single solution that is not the board for seed %d" % seed)
+            return False
+
+    # Boards where a branch runs out of ways to pair the trees and tents
+    for seed in [27, 126, 271, 436]:
+        rng = random.Random(seed)
+        board = tree_game_lib.create_board(rng.randint(4, 14), rng.randint(4, 14), rng.choice([10, 15, 20, 30]),
+                                           rng=seed)
+        for solution in tree_game_lib.find_solutions(board, limit=6):
+            if tree_game_lib.match_trees(solution) is None:
+                print("find_solutions(board) found a board whose trees cannot all have a tent for seed %d" % seed)
+                return False
+
+    return True
+
+
+def test_search_regions():
+    # Two copies of a puzzle in opposite corners share no rows or cols
+    board = tree_game_lib.Board(21, 21)
+    puzzle = tree_game_lib.generate_puzzle(10, 10, rng=0)
+    for corner in [0, 11]:
+        for row in range(10):
+            for col in range(10):
+                board.set_cell(corner + row, corner + col, puzzle.get_cell(row, col))
+    row_tents, col_tents = tree_game_lib.clues(board)
+    guess = tree_game_lib.create_guess_board(board)
+    tree_game_lib.fill_empty(board, guess)
+    tree_game_lib.solver(board, guess, matching=True)
+    regions = tree_game_lib.split_regions(guess, row_tents, col_tents)
+    if len(regions) != 2:
+        print("split_regions() split two puzzles into %d regions" % len(regions))
+        return False
+    for top, left, region, rows, cols in regions:
+        if top < 11 <= top + region.rows or left < 11 <= left + region.cols:
+            print("split_regions() joined the two corners of the board")
+            return False
+    solutions = tree_game_lib.find_solutions(board, limit=2)
+    if len(solutions) != 1 or not tree_game_lib.solved(board, solutions[0]):
+        print("find_solutions() did not find the one solution of two puzzles side by side")
+        return False
+
+    # Seeds 133 and 2802 have regions crossing a row or col whose
+    # empty squares all belong to another region
+    boards = [tree_game_lib.create_board(6, 5, 40, rng=133), tree_game_lib.create_board(9, 8, 20, rng=2802)]
+    for seed in range(150):
+        rng = random.Random(seed)
+        boards.append(tree_game_lib.create_board(rng.randint(4, 14), rng.randint(4, 14),
+                                                 rng.choice([10, 15, 20, 30]), rng=seed))
+    for seed, board in zip([133, 2802] + list(range(150)), boards):
+        row_tents, col_tents = tree_game_lib.clues(board)
+        guess = tree_game_lib.create_guess_board(board)
+        tree_game_lib.fill_empty(board, guess)
+        whole = tree_game_lib.search(guess, row_tents, col_tents, limit=6)
+        solutions = tree_game_lib.search_regions(guess, row_tents, col_tents, limit=6)
+        if len(solutions) != len(whole) or len({bytes(solution.cells) for solution in solutions}) != len(solutions):
+            print("search_regions() found %d solutions and search() %d for seed %d" %
+                  (len(solutions), len(whole), seed))
+            return False
+        for solution in solutions + whole:
+            if tree_game_lib.clues(solution) != (row_tents, col_tents) or tree_game_lib.match_trees(solution) is None:
+                print("search_regions() or search() found a board that is not a solution for seed %d" % seed)
+                return False
+
+    return True
+
+
+def test_quick_reject():
+    # The two tents can swap trees: (0,1)+(2,2) or (0,2)+(2,1)
+    board = [
+        [tree_game_lib.BOARD_EMPTY, tree_game_lib.BOARD_TENT, tree_game_lib.BOARD_EMPTY],
+        [tree_game_lib.BOARD_EMPTY, tree_game_lib.BOARD_TREE, tree_game_lib.BOARD_TREE],
+        [tree_game_lib.BOARD_EMPTY, tree_game_lib.BOARD_EMPTY, tree_game_lib.BOARD_TENT],
+    ]
+    if tree_game_lib.find_swap(board) is None:
+        print("find_swap(board) missed the two tents that can swap")
+        return False
+    if tree_game_lib.quick_reject(board, min_trees=3) is None:
+        print("quick_reject(board, min_trees=3) passed a board with 2 trees")
+        return False
+
+    for seed in range(100):
+        random.seed(seed)
+        board = tree_game_lib.create_board(8, 8, density=40)
+        count = tree_game_lib.count_solutions(board)
+        if count == 1 and tree_game_lib.quick_reject(board) is not None:
+            print("quick_reject(board) rejected a board with one solution for seed %d" % seed)
+            return False
+
+        guess = tree_game_lib.solve_by_deduction(board)
+        if guess is not None and (count != 1 or not tree_game_lib.solved(board, guess)):
+            print("solve_by_deduction(board) solved a board it should not have for seed %d" % seed)
+            return False
+
+    board = tree_game_lib.generate_puzzle(8, 8, rng=1, deduce=True)
+    if tree_game_lib.solve_by_deduction(board) is None:
+        print("generate_puzzle(deduce=True) made a puzzle that needs guessing")
+        return False
+
+    return True
+
+
+def test_build_puzzle():
+    for seed in range(10):
+        board = tree_game_lib.build_puzzle(9, 9, rng=seed)
+        if not any(board.row_counts[tree_game_lib.CELL_TREE]):
+            print("build_puzzle() put no trees on the board for seed %d" % seed)
+            return False
+        if tree_game_lib.count_solutions(board) != 1 or tree_game_lib.solve_by_deduction(board) is None:
+            print("build_puzzle() built a puzzle the solver cannot finish for seed %d" % seed)
+            return False
+        if tree_game_lib.build_puzzle(9, 9, rng=seed).to_lists() != board.to_lists():
+            print("build_puzzle() built two different puzzles from seed %d" % seed)
+            return False
+
+        # The stats come from building the puzzle, not from solving it again
+        stats = tree_game_lib.SolverStats()
+        tree_game_lib.build_puzzle(9, 9, rng=seed, stats=stats)
+        solved = tree_game_lib.SolverStats()
+        tree_game_lib.solve_by_deduction(board, stats=solved)
+        if (stats.examined, stats.decided, stats.depth) != (solved.examined, solved.decided, solved.depth):
+            print("build_puzzle() counted different work than solve_by_deduction() for seed %d" % seed)
+            return False
+
+    return True
+
+
+def test_grade_puzzle():
+    # A single tree in a corner: its tent is found at depth 1
+    board = [
+        [tree_game_lib.BOARD_TREE, tree_game_lib.BOARD_TENT],
+        [tree_game_lib.BOARD_EMPTY, tree_game_lib.BOARD_EMPTY],
+    ]
+    stats = tree_game_lib.SolverStats()
+    if tree_game_lib.solve_by_deduction(board, stats=stats) is None or stats.depth != 1:
+        print("solve_by_deduction(board) reached depth %d, expected 1" % stats.depth)
+        return False
+
+    for seed in range(10):
+        stats = tree_game_lib.SolverStats()
+        board = tree_game_lib.generate_puzzle(8, 8, rng=seed, stats=stats)
+        score = tree_game_lib.grade_puzzle(board, stats=stats)
+        if score < stats.depth:
+            print("grade_puzzle(board) scored %d below the depth %d for seed %d" % (score, stats.depth, seed))
+            return False
+        if stats.branches and score < tree_game_lib.GUESS_WEIGHT:
+            print("grade_puzzle(board) scored a puzzle that needs guessing %d for seed %d" % (score, seed))
+            return False
+
+        stats = tree_game_lib.SolverStats()
+        board = tree_game_lib.build_puzzle(8, 8, rng=seed, stats=stats)
+        if tree_game_lib.grade_puzzle(board, stats=stats) != tree_game_lib.grade_puzzle(board):
+            print("grade_puzzle(board) scored build_puzzle()'s stats differently for seed %d" % seed)
+            return False
+
+    return True
+
+
+def test_numpy():
+    try:
+        import tree_game_numpy
+    except ImportError:
+        print("INFO: numpy is not installed, skipping test_numpy")
+        return True
+
+    random.seed(0)
+    boards = [tree_game_lib.create_board(8, 9, density=40) for i in range(50)]
+    stack = tree_game_numpy.stack(boards)
+    guesses = tree_game_numpy.create_guess_boards(stack)
+    tree_game_numpy.fill_empty(stack, guesses)
+    tree_game_numpy.solver(stack, guesses)
+    done = tree_game_numpy.solved(stack, guesses)
+
+    for i in range(len(boards)):
+        guess = tree_game_lib.create_guess_board(boards[i])
+        tree_game_lib.fill_empty(boards[i], guess)
+        tree_game_lib.solver(boards[i], guess)
+        if tree_game_numpy.from_array(guesses[i]).to_lists() != guess.to_lists():
+            print("tree_game_numpy.solver() and solver() disagree on board %d" % i)
+            return False
+        if done[i] != tree_game_lib.solved(boards[i], guess):
+            print("tree_game_numpy.solved() and solved() disagree on board %d" % i)
+            return False
+
+    return True
+
+
+def test_generate_one():
+    board = tree_game_gen.generate_one(7, 6, 6, 40)
+    if tree_game_lib.count_solutions(board) != 1:
+        print("generate_one(7, 6, 6, 40) made a puzzle without exactly one solution")
+        return False
+
+    again = tree_game_gen.generate_one(7, 6, 6, 40)
+    if board.to_lists() != again.to_lists():
+        print("generate_one(7, 6, 6, 40) made a different board the second time")
+        return False
+
+    return True
+
+
+def test_generate_puzzles():
+    if multiprocessing.get_start_method() != 'fork':
+        # The workers would run this whole file again as they start
+        print("INFO: processes are not forked here, skipping test_generate_puzzles")
+        return True
+
+    puzzles = list(tree_game_gen.generate_puzzles(6, 6, 6, workers=2, seed=100))
+    if len(puzzles) != 6 or len({name for name, board in puzzles}) != 6:
+        print("generate_puzzles(6, ...) made %d puzzles with %d different ids" %
+              (len(puzzles), len({name for name, board in puzzles})))
+        return False
+    if len({tuple(map(tuple, board.to_lists())) for name, board in puzzles}) != 6:
+        print("generate_puzzles(6, ...) made the same board more than once")
+        return False
+    for name, board in puzzles:
+        if tree_game_lib.count_solutions(board) != 1:
+            print("generate_puzzles() made puzzle %s without exactly one solution" % name)
+            return False
+        if board.to_lists() != tree_game_lib.puzzle_from_id(name).to_lists():
+            print("generate_puzzles() made puzzle %s, which puzzle_from_id() does not" % name)
+            return False
+
+    return True
+
+
+def test_puzzle_pool():
+    pool = tree_game_gen.PuzzlePool(low=1, high=3, max_configs=2)
+    try:
+        pool.warm(6, 6)
+        for i in range(100):
+            if pool.ready(6, 6) == 3:
+                break
+            time.sleep(0.05)
+        else:
+            print("PuzzlePool.warm(6, 6) did not fill the pool to 3")
+            return False
+
+        board = pool.take(6, 6)
+        if board is None or tree_game_lib.count_solutions(board) != 1:
+            print("PuzzlePool.take(6, 6) did not give a puzzle with one solution")
+            return False
+        if pool.take(5, 5) is not None or pool.get(4, 4) is None:
+            print("PuzzlePool gave a puzzle it did not have ready, or get() gave none")
+            return False
+        if list(pool.pools) != [(5, 5, 40), (4, 4, 40)]:
+            print("PuzzlePool kept %s, expected the two most recently used" % list(pool.pools))
+            return False
+        if (6, 6, 40) in pool.pending:
+            print("PuzzlePool still counts puzzles pending for the pool it dropped")
+            return False
+    finally:
+        pool.close()
+
+    return True
+
+
+def test_stream_puzzles():
+    stream = tree_game_gen.stream_puzzles(7, 7, seed=3, stages=[tree_game_gen.keep_unique,
+                                                                tree_game_gen.keep_difficulty(0, 1000)])
+    seeds = []
+    for puzzle, solution, metadata in itertools.islice(stream, 5):
+        if tree_game_lib.count_solutions(solution) != 1 or 'difficulty' not in metadata:
+            print("stream_puzzles() passed on seed %d without checking it" % metadata['seed'])
+            return False
+        if any(puzzle.row_counts[tree_game_lib.CELL_TENT]) or \
+                puzzle.row_counts[tree_game_lib.CELL_TREE] != solution.row_counts[tree_game_lib.CELL_TREE]:
+            print("stream_puzzles() gave a puzzle that is not the solution's trees for seed %d" % metadata['seed'])
+            return False
+        seeds.append(metadata['seed'])
+    if seeds != sorted(seeds) or seeds[0] < 3:
+        print("stream_puzzles() seeds %s are out of order" % seeds)
+        return False
+
+    stream = tree_game_gen.stream_puzzles(6, 6, seed=0, build=True, stages=[
+        tree_game_gen.keep_solvable, lambda item: tree_game_pack.pack_board(item[1])])
+    batches = list(itertools.islice(tree_game_gen.batched(stream, 4), 2))
+    if [len(batch) for batch in batches] != [4, 4] or not all(isinstance(data, bytes) for data in batches[1]):
+        print("batched(stream_puzzles(...), 4) did not give two batches of 4 packed boards")
+        return False
+
+    return True
+
+
+def test_puzzle_id():
+    name = tree_game_lib.puzzle_id(6, 7, 40, 0xc0ffee)
+    if tree_game_lib.parse_puzzle_id(name) != (6, 7, 40, 0xc0ffee):
+        print("parse_puzzle_id(%s) returned %s, expected (6, 7, 40, 0xc0ffee)" % (name, tree_game_lib.parse_puzzle_id(name)))
+        return False
+
+    board = tree_game_lib.puzzle_from_id(name)
+    if len(board) != 6 or len(board[0]) != 7:
+        print("puzzle_from_id(%s) is %dx%d, expected 6x7" % (name, len(board), len(board[0])))
+        return False
+
+    if tree_game_lib.puzzle_from_id(name).to_lists() != board.to_lists():
+        print("puzzle_from_id(%s) made a different board the second time" % name)
+        return False
+
+    if tree_game_gen.generate_one(0xc0ffee, 6, 7, 40).to_lists() != board.to_lists():
+        print("generate_one() and puzzle_from_id(%s) made different boards" % name)
+        return False
+
+    for rng in [5, random.Random(5)]:
+        if tree_game_lib.create_board(9, 9, rng=rng).to_lists() != tree_game_lib.create_board(9, 9, rng=5).to_lists():
+            print("create_board(rng=%s) and create_board(rng=5) made different boards" % rng)
+            return False
+
+    return True
+
+
+def test_bitboard():
+    bits = tree_game_bitboard.BitBoard.from_board(board1)
+    if bits.to_board().to_lists() != board1:
+        print("BitBoard.from_board(board1).to_board() != board1")
+        return False
+
+    for r in range(len(board1)):
+        if tree_game_bitboard.count_tents(bits, row=r) != tree_game_lib.count_tents(board1, row=r):
+            print("bitboard count_tents(row=%d) disagrees with count_tents()" % r)
+            return False
+        for c in range(len(board1[0])):
+            if tree_game_bitboard.can_place_tent(bits, r, c) != tree_game_lib.can_place_tent(board1, r, c):
+                print("bitboard can_place_tent(%d, %d) disagrees with can_place_tent()" % (r, c))
+                return False
+
+    for seed in range(50):
+        random.seed(seed)
+        board = tree_game_lib.create_board(9, 40, density=40)
+        guess = tree_game_lib.create_guess_board(board)
+        tree_game_lib.fill_empty(board, guess)
+        tree_game_lib.solver(board, guess)
+
+        bits = tree_game_bitboard.BitBoard.from_board(board)
+        bits_guess = tree_game_bitboard.create_guess_board(bits)
+        tree_game_bitboard.fill_empty(bits, bits_guess)
+        tree_game_bitboard.solver(bits, bits_guess)
+        if bits_guess.to_board().to_lists() != guess.to_lists():
+            print("bitboard solver() and solver() disagree for seed %d" % seed)
+            return False
+
+    return True
+
+
+def test_pack():
+    boards = [tree_game_lib.create_board(rows, cols, rng=rows * cols) for rows, cols in [[1, 1], [3, 5], [6, 6], [9, 2]]]
+    boards.append(board1)
+    for board in boards:
+        packed = tree_game_pack.pack_board(board)
+        if tree_game_pack.unpack_board(packed).to_lists() != tree_game_lib.as_board(board).to_lists():
+            print("unpack_board(pack_board(board)) changed the board")
+            return False
+
+    handle, path = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        if tree_game_pack.write_pack(path, iter(boards)) != len(boards):
+            print("write_pack() did not write %d boards" % len(boards))
+            return False
+        with tree_game_pack.PuzzlePack(path) as pack:
+            if len(pack) != len(boards):
+                print("PuzzlePack has %d boards, expected %d" % (len(pack), len(boards)))
+                return False
+            for n in [3, 0, -1, 2]:
+                if pack[n].to_lists() != tree_game_lib.as_board(boards[n]).to_lists():
+                    print("PuzzlePack[%d] is not the board written" % n)
+                    return False
+            try:
+                pack[len(boards)]
+                print("PuzzlePack[%d] did not raise IndexError" % len(boards))
+                return False
+            except IndexError:
+                pass
+
+        with open(path, 'wb') as f:
+            f.write(b'not a pack, not a pack, not a pack')
+        try:
+            tree_game_pack.PuzzlePack(path)
+            print("PuzzlePack() opened a file that is not a pack")
+            return False
+        except ValueError:
+            pass
+    finally:
+        os.remove(path)
+
+    return True
+
+
+def test_solve_cache():
+    cache = tree_game_cache.SolveCache(maxsize=4)
+    for seed in range(6):
+        board = tree_game_lib.create_board(4, 6, rng=seed)
+        squares = board.to_lists()
+        turned = [list(row) for row in zip(*squares[::-1])]
+        mirrored = [row[::-1] for row in squares]
+        if len({tree_game_cache.puzzle_hash(copy) for copy in [board, turned, mirrored]}) != 1:
+            print("puzzle_hash() differs for a turned or mirrored board for seed %d" % seed)
+            return False
+
+        misses = cache.misses
+        for copy in [board, turned, mirrored]:
+            count, solution = cache.solve(copy)
+            if count != tree_game_lib.count_solutions(copy):
+                print("SolveCache.solve() counted %d solutions for seed %d" % (count, seed))
+                return False
+            if count == 1 and not tree_game_lib.solved(copy, solution):
+                print("SolveCache.solve() gave the wrong solution for seed %d" % seed)
+                return False
+        if cache.misses != misses + 1:
+            print("SolveCache solved the same puzzle %d times for seed %d" % (cache.misses - misses, seed))
+            return False
+
+    if len(cache) != 4:
+        print("SolveCache(maxsize=4) kept %d puzzles" % len(cache))
+        return False
+
+    handle, path = tempfile.mkstemp()
+    os.close(handle)
+    try:
+        cache.save(path)
+        loaded = tree_game_cache.SolveCache(path=path)
+        loaded.solve(board)
+        if len(loaded) != 4 or loaded.hits != 1:
+            print("SolveCache(path=...) did not load the saved puzzles")
+            return False
+
+        # A file with a solution that does not fit its puzzle is refused
+        with open(path) as f:
+            entries = json.load(f)
+        entries[0][1:] = [1, '01']
+        with open(path, 'w') as f:
+            json.dump(entries, f)
+        try:
+            tree_game_cache.SolveCache(path=path)
+        except ValueError:
+            pass
+        else:
+            print("SolveCache(path=...) loaded a broken file")
+            return False
+    finally:
+        os.remove(path)
+
+    return True
+
+
+def test_board_renderer():
+    out = io.StringIO()
+    tree_game_lib.print_board(board1, out=out)
+    expected = [
+        " 312",
+        " ---",
+        "│ŶŶ │ 0",
+        "│^ Ŷ│ 1",
+        "│^ ^│ 2",
+        "│^^^│ 3",
+        " ---",
+    ]
+    if out.getvalue() != "\n".join(expected) + "\n":
+        print("print_board(board1) printed %r, expected %r" % (out.getvalue(), expected))
+        return False
+
+    guess = tree_game_lib.create_guess_board(board1)
+    renderer = tree_game_lib.BoardRenderer(board1, out=io.StringIO())
+    renderer.draw(guess)
+    tree_game_lib.set(guess, 2, 1, tree_game_lib.BOARD_EMPTY_GUESS)
+    renderer.out = io.StringIO()
+    renderer.draw(guess)
+    expected = tree_game_lib.ansi_move(5, 3) + tree_game_lib.BOARD_EMPTY_GUESS + \
+        tree_game_lib.ansi_move(8, 1) + tree_game_lib.ANSI_CLEAR_BELOW
+    if renderer.out.getvalue() != expected:
+        print("BoardRenderer.draw() wrote %r after one change, expected %r" % (renderer.out.getvalue(), expected))
+        return False
+
+    # A message goes after the board, in the same write that clears the old one
+    renderer.out = io.StringIO()
+    renderer.draw(guess, message='Please do not cut down the trees!')
+    expected = tree_game_lib.ansi_move(8, 1) + tree_game_lib.ANSI_CLEAR_BELOW + 'Please do not cut down the trees!\n'
+    if renderer.out.getvalue() != expected:
+        print("BoardRenderer.draw(message=...) wrote %r, expected %r" % (renderer.out.getvalue(), expected))
+        return False
+    renderer.reset()
+    renderer.out = io.StringIO()
+    renderer.draw(guess, message='Please do not cut down the trees!')
+    if not renderer.out.getvalue().endswith(' ---\nPlease do not cut down the trees!\n'):
+        print("BoardRenderer.draw(message=...) wrote %r after reset()" % renderer.out.getvalue())
+        return False
+
+    return True
+
+
+def test_game():
+    board = tree_game_lib.create_board(5, 5, rng=3)
+    game = tree_game_lib.Game(board)
+    game.command('8')
+    game.command('4')
+    if game.cursor != [4, 4]:
+        print("Game.command() moved the cursor to %s, expected [4, 4]" % game.cursor)
+        return False
+
+    before = game.guess.to_lists()
+    message = game.command('^')
+    if board[4][4] == tree_game_lib.BOARD_TREE:
+        if not message:
+            print("Game.command('^') put a tent on a tree")
+            return False
+    elif game.guess[4][4] != tree_game_lib.BOARD_TENT:
+        print("Game.command('^') did not put a tent at 4,4")
+        return False
+    game.command('u')
+    if game.guess.to_lists() != before:
+        print("Game.command('u') did not undo the tent")
+        return False
+
+    for row in range(5):
+        for col in range(5):
+            game.cursor = [row, col]
+            game.command('?')
+    if not game.guess.is_solved():
+        print("Revealing every square with Game.command('?') did not solve the board")
+        return False
+
+    if game.command('x') != tree_game_lib.HELP:
+        print("Game.command('x') did not return the help")
+        return False
+
+    return True
+
+
+def test_hint_engine():
+    board = tree_game_lib.build_puzzle(9, 9, rng=5)
+    guess = tree_game_lib.GuessBoard.from_puzzle(board)
+    tree_game_lib.fill_empty(board, guess)
+    engine = tree_game_lib.HintEngine(board, guess)
+
+    # Following every hint, with an undo now and then, solves the puzzle
+    hints = 0
+    while True:
+        found = engine.hint()
+        if found is None:
+            break
+        rule, row, col, cell = found
+        if rule not in tree_game_lib.RULE_HINTS or (cell == tree_game_lib.CELL_TENT) != \
+                (board.get_cell(row, col) == tree_game_lib.CELL_TENT):
+            print("HintEngine.hint() gave %s at %d,%d, which is wrong" % (rule, row, col))
+            return False
+        snapshot = guess.snapshot()
+        guess.set_cell(row, col, cell)
+        hints += 1
+        if hints % 7 == 0:
+            guess.rollback(snapshot)
+            guess.set_cell(row, col, cell)
+    if not guess.is_solved() or engine.mistake:
+        print("Following HintEngine.hint() did not solve the puzzle")
+        return False
+
+    # A tent where there is none is found to be a mistake
+    guess = tree_game_lib.GuessBoard.from_puzzle(board)
+    engine = tree_game_lib.HintEngine(board, guess)
+    for row in range(9):
+        for col in range(9):
+            if board.get_cell(row, col) == tree_game_lib.CELL_EMPTY:
+                guess.set_cell(row, col, tree_game_lib.CELL_TENT)
+    if engine.hint() is not None or not engine.mistake:
+        print("HintEngine.hint() did not notice a board full of wrong tents")
+        return False
+
+    game = tree_game_lib.Game(board)
+    if not game.command('n') or game.guess.snapshot() == 0:
+        print("Game.command('n') did not fill in a square")
+        return False
+
+    return True
+
+
+def test_game_server():
+    async def run():
+        game_server = tree_game_server.GameServer(5, 5)
+        server = await game_server.start(port=0)
+        port = server.sockets[0].getsockname()[1]
+        result = await tree_game_server.load_test(port=port, clients=20, moves=10, seed=1)
+        server.close()
+        await server.wait_closed()
+        return game_server, result
+
+    game_server, result = asyncio.run(run())
+    if game_server.played != 20 or game_server.sessions != 0:
+        print("GameServer played %d games with %d left open, expected 20 and 0" % (
+            game_server.played, game_server.sessions))
+        return False
+    if result['replies'] < 20:
+        print("load_test() got only %d replies" % result['replies'])
+        return False
+
+    async def run_long_lines():
+        game_server = tree_game_server.GameServer(5, 5)
+        server = await game_server.start(port=0)
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.sockets[0].getsockname()[1])
+        await tree_game_server.read_reply(reader)
+        # 's' runs the solver off the event loop and still answers
+        writer.write(b's\n')
+        board = await tree_game_server.read_reply(reader)
+        writer.close()
+        reader, writer = await asyncio.open_connection('127.0.0.1', server.sockets[0].getsockname()[1])
+        await tree_game_server.read_reply(reader)
+        writer.write(b'x' * 100000 + b'\n')
+        header = await reader.readline()
+        closed = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return game_server, board, header, closed
+
+    game_server, board, header, closed = asyncio.run(run_long_lines())
+    if not board:
+        print("GameServer did not answer 's' with the board")
+        return False
+    if not header.startswith(b'ERR') or closed or game_server.sessions != 0:
+        print("GameServer answered %r to a line that was too long" % header)
+        return False
+
+    return True
+
+
+def test_bench_board():
+    result = tree_game_bench.bench_board(6, 6, 40, repeat=1)
+    for name in ['create_board', 'create_guess_board', 'fill_empty', 'solver', 'solved', 'print_board']:
+        if name not in result['seconds']:
+            print("bench_board() did not time %s" % name)
+            return False
+
+    lines = tree_game_bench.compare({'results': [result]}, {'results': [result]})
+    if len(lines) != len([seconds for seconds in result['seconds'].values() if seconds]):
+        print("compare() of a run with itself returned %d lines" % len(lines))
+        return False
+
+    return True
+
+
 def test_create_board():
     # TODO: write a test
     return True
@@ -182,6 +1109,8 @@ if not test_validate():
     exit(1)
 if not test_get():
     exit(1)
+if not test_board():
+    exit(1)
 if not test_percent_chance():
     exit(1)
 if not test_is_tent():
@@ -192,6 +1121,56 @@ if not test_can_place_tent():
     exit(1)
 if not test_place_tree_and_tent():
     exit(1)
+if not test_journal_board():
+    exit(1)
+if not test_guess_board():
+    exit(1)
+if not test_board_counts():
+    exit(1)
+if not test_solver():
+    exit(1)
+if not test_solver_matching():
+    exit(1)
+if not test_solver_stats():
+    exit(1)
+if not test_count_solutions():
+    exit(1)
+if not test_search_regions():
+    exit(1)
+if not test_quick_reject():
+    exit(1)
+if not test_build_puzzle():
+    exit(1)
+if not test_grade_puzzle():
+    exit(1)
+if not test_numpy():
+    exit(1)
+if not test_generate_one():
+    exit(1)
+if not test_generate_puzzles():
+    exit(1)
+if not test_puzzle_pool():
+    exit(1)
+if not test_stream_puzzles():
+    exit(1)
+if not test_puzzle_id():
+    exit(1)
+if not test_bitboard():
+    exit(1)
+if not test_pack():
+    exit(1)
+if not test_solve_cache():
+    exit(1)
+if not test_board_renderer():
+    exit(1)
+if not test_game():
+    exit(1)
+if not test_hint_engine():
+    exit(1)
+if not test_game_server():
+    exit(1)
+if not test_bench_board():
+    exit(1)
 if not test_create_board():
     exit(1)
 if not test_create_guess_board():